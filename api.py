@@ -0,0 +1,217 @@
+import argparse
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+from monedas import MONEDA_BASE, convertir, monedas_disponibles, version_tasas
+from nucleo import leer_df_cacheado, normalizar_usuario, totales_por_periodo, version_ledger
+
+# Respuestas guardadas en memoria (LRU)
+MAX_RESPUESTAS = 512
+GRANULARIDADES = {"dia": "D", "semana": "W", "mes": "M"}
+
+
+class ErrorConsulta(ValueError):
+    """Parámetros inválidos -> 400"""
+
+
+# ----------------------------
+# Respuestas en memoria (los ledgers van en el caché compartido del núcleo)
+# ----------------------------
+_lock = threading.Lock()
+_respuestas = OrderedDict()
+
+
+def _fecha(params: dict, nombre: str) -> date | None:
+    valor = params.get(nombre, [None])[0]
+    if not valor:
+        return None
+    try:
+        return date.fromisoformat(valor)
+    except ValueError:
+        raise ErrorConsulta(f"'{nombre}' debe ser AAAA-MM-DD")
+
+
+def _filtrar(df: pd.DataFrame, params: dict) -> pd.DataFrame:
+    """Filtros comunes: ?desde=AAAA-MM-DD&hasta=AAAA-MM-DD&categoria=Comida,Hogar"""
+    desde = _fecha(params, "desde")
+    hasta = _fecha(params, "hasta")
+    if desde is not None:
+        df = df[df["Fecha"] >= desde]
+    if hasta is not None:
+        df = df[df["Fecha"] <= hasta]
+    cats = [c for valor in params.get("categoria", []) for c in valor.split(",") if c]
+    if cats:
+        df = df[df["Categoria"].isin(cats)]
+    return df
+
+
+def _moneda(params: dict) -> str:
+    """?moneda=EUR (por defecto MONEDA_BASE)"""
+    moneda = params.get("moneda", [MONEDA_BASE])[0].strip().upper()
+    if moneda not in monedas_disponibles():
+        raise ErrorConsulta(f"'moneda' debe ser una de {', '.join(monedas_disponibles())}")
+    return moneda
+
+
+def _convertido(df: pd.DataFrame, params: dict) -> pd.DataFrame:
+    # Filtra primero: solo se convierten las filas que van en la respuesta
+    df = _filtrar(df, params)
+    return df.assign(Monto=convertir(df, _moneda(params)))
+
+
+# ----------------------------
+# Endpoints
+# ----------------------------
+def totales(df: pd.DataFrame, params: dict) -> dict:
+    moneda = _moneda(params)
+    total_hoy, total_sem, total_mes, *_ = totales_por_periodo(_filtrar(df, params), moneda)
+    return {"hoy": total_hoy, "semana": total_sem, "mes": total_mes, "moneda": moneda}
+
+
+def categorias(df: pd.DataFrame, params: dict) -> list[dict]:
+    df = _convertido(df, params)
+    resumen = df.groupby("Categoria")["Monto"].agg(["sum", "count"]).sort_values("sum", ascending=False)
+    return [
+        {"Categoria": cat, "total": float(fila["sum"]), "movimientos": int(fila["count"])}
+        for cat, fila in resumen.iterrows()
+    ]
+
+
+def movimientos(df: pd.DataFrame, params: dict) -> list[dict]:
+    try:
+        limite = int(params.get("limite", ["100"])[0])
+    except ValueError:
+        raise ErrorConsulta("'limite' debe ser un entero")
+    if limite < 1:
+        # head(-n) devolvería todo menos las últimas n filas
+        raise ErrorConsulta("'limite' debe ser mayor que 0")
+    df = _filtrar(df, params).sort_values("Fecha", ascending=False, kind="stable").head(limite)
+    if "moneda" in params:
+        moneda = _moneda(params)
+        df = df.assign(MontoOriginal=df["Monto"], MonedaOriginal=df["Moneda"],
+                       Monto=convertir(df, moneda), Moneda=moneda)
+    df = df.assign(Fecha=df["Fecha"].astype(str))
+    # NaN (ej. Descripcion vacía) no es JSON válido: va como null
+    return df.astype(object).where(df.notna(), None).to_dict("records")
+
+
+def rollups(df: pd.DataFrame, params: dict) -> list[dict]:
+    granularidad = params.get("granularidad", ["mes"])[0]
+    if granularidad not in GRANULARIDADES:
+        raise ErrorConsulta(f"'granularidad' debe ser una de {', '.join(GRANULARIDADES)}")
+    df = _convertido(df, params)
+    if df.empty:
+        return []
+    periodo = pd.to_datetime(df["Fecha"]).dt.to_period(GRANULARIDADES[granularidad])
+    serie = df.groupby(periodo)["Monto"].sum()
+    return [{"periodo": str(p), "total": float(v)} for p, v in serie.items()]
+
+
+RUTAS = {
+    "/totales": totales,
+    "/categorias": categorias,
+    "/movimientos": movimientos,
+    "/rollups": rollups,
+}
+
+
+def responder(ruta: str, query: str) -> tuple[str, bytes]:
+    """
+    Devuelve (etag, cuerpo JSON). La llave incluye la versión del ledger,
+    así cualquier escritura invalida las respuestas viejas sin recorrerlas.
+    """
+    params = parse_qs(query)
+    # ?usuario=ana -> usuarios/ana/; sin usuario, el ledger compartido
+    usuario = normalizar_usuario(params.get("usuario", [""])[0])
+    consulta = tuple(sorted((k, tuple(v)) for k, v in params.items()))
+    # La versión del ledger ya incluye al usuario;
+    # hoy: /totales cambia a medianoche aunque el ledger no cambie;
+    # tasas: editar tasas_cambio.csv cambia los montos convertidos
+    llave = (version_ledger(usuario), ruta, consulta, date.today().isoformat(), version_tasas())
+
+    with _lock:
+        if llave in _respuestas:
+            _respuestas.move_to_end(llave)
+            return _respuestas[llave]
+
+    datos = RUTAS[ruta](leer_df_cacheado(usuario), params)
+    cuerpo = json.dumps(datos, ensure_ascii=False, default=str, allow_nan=False).encode("utf-8")
+    etag = '"' + hashlib.sha1(repr(llave).encode("utf-8")).hexdigest()[:20] + '"'
+
+    with _lock:
+        _respuestas[llave] = (etag, cuerpo)
+        if len(_respuestas) > MAX_RESPUESTAS:
+            _respuestas.popitem(last=False)
+    return etag, cuerpo
+
+
+# ----------------------------
+# Servidor
+# ----------------------------
+class Handler(BaseHTTPRequestHandler):
+    silencioso = True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path not in RUTAS:
+            self._json(404, {"error": f"Ruta desconocida. Disponibles: {', '.join(RUTAS)}"})
+            return
+        try:
+            etag, cuerpo = responder(url.path, url.query)
+        except ErrorConsulta as e:
+            self._json(400, {"error": str(e)})
+            return
+        except Exception as e:
+            # Sin esto el cliente solo ve la conexión cortada
+            self.log_error("Error en %s: %r", url.path, e)
+            self._json(500, {"error": "Error interno"})
+            return
+
+        if etag in [v.strip() for v in self.headers.get("If-None-Match", "").split(",")]:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def _json(self, codigo: int, datos: dict):
+        cuerpo = json.dumps(datos, ensure_ascii=False).encode("utf-8")
+        self.send_response(codigo)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, format, *args):
+        if not self.silencioso:
+            super().log_message(format, *args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="API de solo lectura sobre el ledger")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8000)
+    parser.add_argument("--log", action="store_true", help="Mostrar cada request")
+    args = parser.parse_args()
+
+    Handler.silencioso = not args.log
+    servidor = ThreadingHTTPServer((args.host, args.puerto), Handler)
+    print(f"📡 API en http://{args.host}:{args.puerto} ({', '.join(RUTAS)})")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        print("Adiós 👋")
@@ -1,47 +1,42 @@
-from openai import OpenAI
-from dotenv import load_dotenv
 import plotly.express as px
 import streamlit as st
-from datetime import date, timedelta
+from datetime import date
 import pandas as pd
-import csv
-import datetime
-import json
 import os
-import re
-from pathlib import Path
-BASE_DIR = Path(__file__).resolve().parent
-CSV_PATH = BASE_DIR / "gastos.csv"
 
-BASE_DIR = Path(__file__).resolve().parent
-CSV_PATH = BASE_DIR / "gastos.csv"
-CATS_PATH = BASE_DIR / "categorias.json"
-
-CATEGORIAS_BASE = [
-    "Comida", "Transporte", "Hogar", "Entretenimiento", "Salud", "Otros"
-]
-
-
-def cargar_categorias() -> list[str]:
-    cats = set(CATEGORIAS_BASE)
-
-    # categorías guardadas en categorias.json
-    if CATS_PATH.exists():
-        try:
-            data = json.loads(CATS_PATH.read_text(encoding="utf-8"))
-            if isinstance(data, list):
-                cats.update([str(x).strip() for x in data if str(x).strip()])
-        except Exception:
-            pass
-
-    return sorted(cats)
-
-
-def guardar_categorias(cats: list[str]) -> None:
-    # guarda solo las extras (no repite base)
-    extras = sorted(set(cats) - set(CATEGORIAS_BASE))
-    CATS_PATH.write_text(json.dumps(
-        extras, ensure_ascii=False, indent=2), encoding="utf-8")
+import cache_usuarios
+import presupuestos
+import pronostico
+import respaldo
+import series
+from monedas import (
+    MONEDA_BASE,
+    convertir,
+    monedas_disponibles,
+    simbolo,
+    version_tasas,
+)
+from nucleo import (
+    api_key,
+    archivos_ledger,
+    cargar_categorias,
+    clasificar_con_ia,
+    crear_archivo,
+    guardar_categorias,
+    guardar_df,
+    guardar_gasto,
+    ledger_vacio,
+    leer_df,
+    leer_ultimos,
+    normalizar_usuario,
+    pronostico_cacheado,
+    rango_fechas_ledger,
+    restaurar_ledger,
+    resumen_por_categoria,
+    rutas,
+    totales_por_periodo,
+    version_ledger,
+)
 
 
 def fmt(valor: float, simbolo: str, decimales: int) -> str:
@@ -50,461 +45,590 @@ def fmt(valor: float, simbolo: str, decimales: int) -> str:
     return f"{simbolo}{valor:,.{decimales}f}"
 
 
-ARCHIVO = str(CSV_PATH)
-CATEGORIAS_VALIDAS = {"Comida", "Transporte",
-                      "Hogar", "Entretenimiento", "Salud", "Otros", "deudas", "imprevistos", "inversiones"}
-
-env_path = Path(__file__).with_name(".env")
-load_dotenv(env_path, override=True)
-
 # 🔐 Si estamos en Streamlit Cloud, usar secrets
 if hasattr(st, "secrets"):
     if "OPENAI_API_KEY" in st.secrets:
         os.environ["OPENAI_API_KEY"] = st.secrets["OPENAI_API_KEY"]
 
-API_KEY = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=API_KEY) if API_KEY else None
-
-
-def crear_archivo():
-    if not os.path.exists(ARCHIVO):
-        with open(ARCHIVO, mode="w", newline="") as file:
-            writer = csv.writer(file)
-            writer.writerow(["Fecha", "Monto", "Categoria", "Descripcion"])
-
-
-def _extraer_json(texto: str) -> str:
-    texto = texto.strip()
-    if texto.startswith("{") and texto.endswith("}"):
-        return texto
-    match = re.search(r"\{.*\}", texto, flags=re.DOTALL)
-    if match:
-        return match.group(0).strip()
-    return texto
-
-
-def _normalizar_categoria(cat: str) -> str:
-    if not isinstance(cat, str):
-        return "Otros"
-    cat = cat.strip()
-    mapping = {
-        "Comida": "Comida",
-        "Alimentacion": "Comida",
-        "Alimentación": "Comida",
-        "Transporte": "Transporte",
-        "Hogar": "Hogar",
-        "Entretenimiento": "Entretenimiento",
-        "Salud": "Salud",
-        "Otros": "Otros",
-    }
-    if cat in CATEGORIAS_VALIDAS:
-        return cat
-    return mapping.get(cat, "Otros")
-
-
-def _normalizar_monto(monto) -> float:
-    if isinstance(monto, (int, float)):
-        return float(monto)
-    if isinstance(monto, str):
-        s = monto.strip()
-        s = s.replace("$", "").replace("USD", "").strip()
-        s = s.replace(",", ".")
-        s = re.sub(r"[^0-9.]", "", s)
-        try:
-            return float(s) if s else 0.0
-        except ValueError:
-            return 0.0
-    return 0.0
-
-
-def clasificar_con_ia(texto_usuario: str, model: str) -> dict:
-    prompt = (
-        "Extrae la siguiente información del texto y responde SOLO con JSON.\n"
-        "Campos obligatorios: Monto (numero), Categoria (string), Descripcion (string).\n"
-        f"Categorias permitidas: {', '.join(sorted(CATEGORIAS_VALIDAS))}.\n\n"
-        f"Texto: {texto_usuario}\n"
-    )
-
-    if not client:
-        return {"Monto": 0.0, "Categoria": "Otros", "Descripcion": texto_usuario}
+API_KEY = api_key()
 
-    try:
-        resp = client.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0,
-            response_format={"type": "json_object"},
-        )
-        raw = resp.choices[0].message.content
-    except Exception:
-        resp = client.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0,
-        )
-        raw = resp.choices[0].message.content
 
-    raw_json = _extraer_json(raw)
-    try:
-        data = json.loads(raw_json)
-    except Exception:
-        return {"Monto": 0.0, "Categoria": "Otros", "Descripcion": texto_usuario}
+# ----------------------------
+# Cache (compartido por todas las sesiones del proceso, por usuario; se
+# invalida cuando cambia el ledger y desaloja por LRU bajo CACHE_MEMORIA_MB)
+# ----------------------------
+def _vacio_cache(usuario: str | None, version: tuple) -> bool:
+    return cache_usuarios.obtener(usuario, ("vacio",), version, lambda: ledger_vacio(usuario))
 
-    monto = _normalizar_monto(data.get("Monto", 0))
-    categoria = _normalizar_categoria(data.get("Categoria", "Otros"))
-    descripcion = data.get("Descripcion", texto_usuario)
-    if not isinstance(descripcion, str) or not descripcion.strip():
-        descripcion = texto_usuario
 
-    return {"Monto": monto, "Categoria": categoria, "Descripcion": descripcion.strip()}
+def _ultimos_cache(usuario: str | None, version: tuple, n: int) -> pd.DataFrame:
+    return cache_usuarios.obtener(
+        usuario, ("ultimos", n), version, lambda: leer_ultimos(n, usuario=usuario))
 
 
-def guardar_gasto(datos: dict):
-    fecha = datetime.datetime.now().strftime("%Y-%m-%d")
-    with open(ARCHIVO, mode="a", newline="") as file:
-        writer = csv.writer(file)
-        writer.writerow(
-            [fecha, datos["Monto"], datos["Categoria"], datos["Descripcion"]])
+def _resumen_cat_cache(usuario: str | None, version: tuple, moneda: str) -> pd.DataFrame:
+    # Una entrada por (versión del ledger, moneda): cambiar de moneda y volver no recalcula
+    return cache_usuarios.obtener(
+        usuario, ("resumen_cat", moneda), (version, version_tasas()),
+        lambda: resumen_por_categoria(moneda, usuario=usuario))
 
 
-def leer_df() -> pd.DataFrame:
-    import pandas as pd
+def _rango_cache(usuario: str | None, version: tuple) -> tuple[date, date]:
+    return cache_usuarios.obtener(
+        usuario, ("rango",), version, lambda: rango_fechas_ledger(usuario))
 
-    if not CSV_PATH.exists():
-        return pd.DataFrame(columns=["Fecha", "Monto", "Categoria", "Detalle"])
 
-    df = pd.read_csv(CSV_PATH)
+def _filtrar_cache(usuario: str | None, version: tuple, fecha_ini: date, fecha_fin: date,
+                   cats_sel: tuple, moneda: str):
+    # hoy va en la versión para que Día/Semana/Mes cambien a medianoche;
+    # moneda y tasas, para que cada moneda se convierta una sola vez
+    def calcular():
+        df = leer_df(fecha_ini, fecha_fin, usuario=usuario)
+        df_filtrado = df[df["Categoria"].isin(cats_sel)].copy()
+        df_filtrado["MontoOriginal"] = df_filtrado["Monto"]
+        df_filtrado["MonedaOriginal"] = df_filtrado["Moneda"]
+        df_filtrado["Monto"] = convertir(df_filtrado, moneda)
+        df_filtrado["Moneda"] = moneda
+        total_hoy, total_sem, total_mes, *_ = totales_por_periodo(df_filtrado)
+        return df_filtrado, (total_hoy, total_sem, total_mes)
 
-    # Limpieza segura
-    if "Fecha" in df.columns:
-        df["Fecha"] = pd.to_datetime(df["Fecha"], errors="coerce").dt.date
-    if "Monto" in df.columns:
-        df["Monto"] = pd.to_numeric(df["Monto"], errors="coerce").fillna(0.0)
+    return cache_usuarios.obtener(
+        usuario, ("filtrar", fecha_ini, fecha_fin, cats_sel, moneda),
+        (version, version_tasas(), date.today()), calcular)
 
-    df = df.dropna(subset=["Fecha"])
-    return df
 
+def _series_cache(usuario: str | None, version: tuple, fecha_ini: date, fecha_fin: date,
+                  cats_sel: tuple, moneda: str) -> dict:
+    # Día/Semana/Mes precalculados una vez por conjunto de filtros
+    def calcular():
+        df_filtrado, _ = _filtrar_cache(usuario, version, fecha_ini, fecha_fin, cats_sel, moneda)
+        return series.precalcular(df_filtrado)
 
-def totales_por_periodo(df_in: pd.DataFrame):
-    # Devuelve: total_hoy, total_sem, total_mes, df_hoy, df_sem, df_mes
+    return cache_usuarios.obtener(
+        usuario, ("series", fecha_ini, fecha_fin, cats_sel, moneda),
+        (version, version_tasas(), date.today()), calcular)
 
-    # Caso None/vacío
-    if df_in is None or df_in.empty:
-        vacio = pd.DataFrame(
-            columns=["Fecha", "Monto", "Categoria", "Descripcion"])
-        return 0.0, 0.0, 0.0, vacio, vacio, vacio
 
-    df = df_in.copy()
+def contar(seccion: str) -> None:
+    """Cuenta cuántas veces se ejecutó cada sección (para ver qué recalcula cada widget)."""
+    contadores = st.session_state.setdefault("_contadores", {})
+    contadores[seccion] = contadores.get(seccion, 0) + 1
 
-    # Asegurar columnas mínimas (por si vienen diferentes)
-    for col in ["Fecha", "Monto", "Categoria", "Descripcion"]:
-        if col not in df.columns:
-            df[col] = None
 
-    # Limpiar tipos
-    df["Fecha"] = pd.to_datetime(df["Fecha"], errors="coerce").dt.date
-    df["Monto"] = pd.to_numeric(df["Monto"], errors="coerce").fillna(0.0)
+# Presupuestos y pronóstico van siempre en MONEDA_BASE; el dashboard, en la
+# moneda elegida en el sidebar
+SIMBOLO = simbolo(MONEDA_BASE)
+DECIMALES = 2
 
-    # Quitar fechas inválidas
-    df = df.dropna(subset=["Fecha"])
 
-    # Si quedó vacío después de limpiar
-    if df.empty:
-        vacio = pd.DataFrame(columns=df.columns)
-        return 0.0, 0.0, 0.0, vacio, vacio, vacio
+def usuario_actual() -> str | None:
+    """Usuario de esta sesión (None = ledger compartido de siempre)."""
+    return normalizar_usuario(st.session_state.get("usuario"))
 
-    hoy = date.today()
-    inicio_semana = hoy - timedelta(days=hoy.weekday())  # lunes
-    inicio_mes = hoy.replace(day=1)
 
-    df_hoy = df[df["Fecha"] == hoy].copy()
-    df_sem = df[(df["Fecha"] >= inicio_semana) & (df["Fecha"] <= hoy)].copy()
-    df_mes = df[(df["Fecha"] >= inicio_mes) & (df["Fecha"] <= hoy)].copy()
+def firma_presupuestos(usuario: str | None) -> tuple:
+    # Los contadores dependen del ledger y de las tasas con que se convirtió
+    return (version_ledger(usuario), version_tasas())
 
-    total_hoy = float(df_hoy["Monto"].sum()) if not df_hoy.empty else 0.0
-    total_sem = float(df_sem["Monto"].sum()) if not df_sem.empty else 0.0
-    total_mes = float(df_mes["Monto"].sum()) if not df_mes.empty else 0.0
 
-    return total_hoy, total_sem, total_mes, df_hoy, df_sem, df_mes
+# ----------------------------
+# Secciones (cada @st.fragment se re-ejecuta solo cuando cambian sus widgets)
+# ----------------------------
+@st.fragment
+def seccion_clasificacion():
+    contar("clasificacion")
+    usuario = usuario_actual()
 
+    if st.session_state.pop("guardado_ok", False):
+        st.success("✅ Guardado en gastos.csv")
+    for alerta in st.session_state.pop("alertas_presupuesto", []):
+        mensaje = (
+            f"{alerta['Categoria']}: {fmt(alerta['gastado'], SIMBOLO, DECIMALES)} "
+            f"de {fmt(alerta['limite'], SIMBOLO, DECIMALES)} este mes"
+        )
+        if alerta["umbral"] >= 1.0:
+            st.error(f"🚨 Presupuesto superado — {mensaje}")
+        else:
+            st.warning(f"⚠️ Llegaste al {alerta['umbral']:.0%} del presupuesto — {mensaje}")
 
-# UI
-st.set_page_config(page_title="Control Financiero IA", layout="centered")
-st.title("💸 Control Financiero con IA")
+    model = st.selectbox("Modelo", ["gpt-4.1-mini"], index=0)
 
-crear_archivo()
+    texto = st.text_input("Escribe tu gasto (Ej: 45 McDonalds)",
+                          placeholder="Ej: 12 uber / 30 mercado / 8 café")
 
-if not API_KEY:
-    st.error("❌ No se encontró OPENAI_API_KEY en .env. Agrega tu key y recarga.")
-    st.stop()
+    c1, c2 = st.columns(2)
+    with c1:
+        btn = st.button("🤖 Clasificar y guardar", use_container_width=True)
+    with c2:
+        btn_preview = st.button("👀 Solo clasificar", use_container_width=True)
 
-colA, colB = st.columns(2)
-with colA:
-    model = st.selectbox("Modelo", ["gpt-4.1-mini"], index=0)
-with colB:
-    ver_historial = st.toggle("Ver historial", value=True)
+    if btn_preview or btn:
 
-texto = st.text_input("Escribe tu gasto (Ej: 45 McDonalds)",
-                      placeholder="Ej: 12 uber / 30 mercado / 8 café")
+        if not texto.strip():
+            st.warning("⚠️ Escribe algo primero.")
+        else:
+            with st.spinner("Procesando con IA..."):
+                datos = clasificar_con_ia(texto, modelo=model, usuario=usuario)
+
+                # Guardamos temporalmente en session_state
+            st.session_state["datos_temp"] = datos
+            st.session_state["datos_id"] = f"{datos.get('Monto')}-{datos.get('Categoria')}-{datos.get('Descripcion')}"
+            # 👈 resetea selección anterior
+            st.session_state.pop("cat_manual", None)
+            st.session_state.pop("moneda_manual", None)
+
+    # Si ya hay datos clasificados, los mostramos
+    datos = st.session_state.get("datos_temp")
+    if datos is not None:
+        st.subheader("Resultado")
+        st.write(f"**Monto:** {datos['Monto']} {datos.get('Moneda', MONEDA_BASE)}")
+        st.write(f"**Categoría IA:** {datos['Categoria']}")
+        st.write(f"**Descripción:** {datos['Descripcion']}")
+
+        categorias = cargar_categorias(usuario)
+        cat_ia = datos["Categoria"]
+        index_default = categorias.index(cat_ia) if cat_ia in categorias else 0
+
+        cat_manual = st.selectbox(
+            "Categoría final",
+            options=categorias,
+            index=index_default,
+            key="cat_manual"
+        )
 
-c1, c2 = st.columns(2)
-with c1:
-    btn = st.button("🤖 Clasificar y guardar", use_container_width=True)
-with c2:
-    btn_preview = st.button("👀 Solo clasificar", use_container_width=True)
+        datos["Categoria"] = cat_manual
+
+        monedas = monedas_disponibles()
+        moneda_ia = datos.get("Moneda", MONEDA_BASE)
+        if moneda_ia not in monedas:
+            monedas.append(moneda_ia)
+        datos["Moneda"] = st.selectbox(
+            "Moneda",
+            options=monedas,
+            index=monedas.index(moneda_ia),
+            key="moneda_manual"
+        )
 
-if btn_preview or btn:
+        if st.button("💾 Confirmar y guardar"):
+            # Contadores al día antes del insert; luego se actualizan en O(1)
+            r = rutas(usuario)
+            presupuestos.sincronizar(
+                firma_presupuestos(usuario), lambda: leer_df(usuario=usuario), r["contadores"])
+            fecha = guardar_gasto(datos, usuario=usuario)
+            st.session_state["alertas_presupuesto"] = presupuestos.registrar_gasto(
+                fecha, datos["Categoria"], datos["Monto"], firma_presupuestos(usuario),
+                ruta=r["contadores"], limites=presupuestos.cargar_presupuestos(r["presupuestos"]),
+                moneda=datos["Moneda"])
+            st.session_state["datos_temp"] = None
+            st.session_state.pop("cat_manual", None)
+            st.session_state.pop("moneda_manual", None)
+            st.session_state["guardado_ok"] = True
+            # El ledger cambió: se recalcula la página completa
+            st.rerun()
 
-    if not texto.strip():
-        st.warning("⚠️ Escribe algo primero.")
-    else:
-        with st.spinner("Procesando con IA..."):
-            datos = clasificar_con_ia(texto, model=model)
-
-            # Guardamos temporalmente en session_state
-        st.session_state["datos_temp"] = datos
-        st.session_state["datos_id"] = f"{datos.get('Monto')}-{datos.get('Categoria')}-{datos.get('Descripcion')}"
-        # 👈 resetea selección anterior
-        st.session_state.pop("cat_manual", None)
-
-
-# Si ya hay datos clasificados, los mostramos
-datos = st.session_state.get("datos_temp")
-if datos is not None:
-    st.subheader("Resultado")
-    st.write(f"**Monto:** {datos['Monto']}")
-    st.write(f"**Categoría IA:** {datos['Categoria']}")
-    st.write(f"**Descripción:** {datos['Descripcion']}")
-
-    categorias = cargar_categorias()
-    cat_ia = datos["Categoria"]
-    index_default = categorias.index(cat_ia) if cat_ia in categorias else 0
-
-    cat_manual = st.selectbox(
-        "Categoría final",
-        options=categorias,
-        index=index_default,
-        key="cat_manual"
-    )
 
-    datos["Categoria"] = cat_manual
+@st.fragment
+def seccion_historial():
+    contar("historial")
+    ver_historial = st.toggle("Ver historial", value=True)
 
-    if st.button("💾 Confirmar y guardar"):
-        guardar_gasto(datos)
-        st.success("✅ Guardado en gastos.csv")
-        st.session_state["datos_temp"] = None
-        st.session_state.pop("cat_manual", None)
+    if ver_historial:
+        st.divider()
+        usuario = usuario_actual()
+        df = _ultimos_cache(usuario, version_ledger(usuario), 10)
 
-if ver_historial:
-    st.divider()
-    df = leer_df()
+        if df.empty:
+            st.info("aun no hay gastos guardados.")
+        else:
+            st.subheader("🧾 ultimos gastos")
+            st.dataframe(df, use_container_width=True)
 
-    if df.empty:
-        st.info("aun no hay gastos guardados.")
-    else:
-        st.subheader("🧾 ultimos gastos")
-        st.dataframe(df.tail(10), use_container_width=True)
+        st.divider()
+        st.subheader("📊 resumen")
 
-    st.divider()
-    st.subheader("📊 resumen")
-# ===== DASHBOARD + GRÁFICO CIRCULAR =====
-df = leer_df()
 
-if df.empty:
-    st.info("Aún no hay gastos guardados.")
-else:
-    # Asegurar tipos
-    import pandas as pd
-    df["Monto"] = pd.to_numeric(df["Monto"], errors="coerce").fillna(0.0)
+def seccion_resumen(vacio: bool, moneda: str):
+    # ===== DASHBOARD + GRÁFICO CIRCULAR =====
+    contar("resumen")
+    if vacio:
+        st.info("Aún no hay gastos guardados.")
+        return
 
     # --- Gráfico circular por categoría ---
     st.subheader("🥧 Gastos por categoría")
 
-    resumen_cat = (
-        df.groupby("Categoria", as_index=False)["Monto"]
-        .sum()
-        .sort_values("Monto", ascending=False)
+    usuario = usuario_actual()
+    resumen_cat = _resumen_cat_cache(usuario, version_ledger(usuario), moneda)
+    fig = px.pie(resumen_cat, names="Categoria", values="Monto")
+    st.plotly_chart(fig, use_container_width=True, key="pie_resumen")
+
+
+def seccion_usuario() -> str | None:
+    # Fuera de un fragment: cambiar de usuario re-ejecuta toda la página
+    contar("usuario")
+    if "usuario" not in st.session_state:
+        # ?u=ana en la URL entra directo a ese ledger
+        st.session_state["usuario"] = st.query_params.get("u", "")
+    st.text_input("👤 Usuario", key="usuario", placeholder="Vacío = ledger compartido")
+    usuario = usuario_actual()
+    if usuario:
+        st.query_params["u"] = usuario
+    elif "u" in st.query_params:
+        del st.query_params["u"]
+    return usuario
+
+
+def seccion_moneda() -> str:
+    # Fuera de un fragment: cambiar la moneda re-ejecuta toda la página
+    # (las conversiones quedan en caché por moneda)
+    contar("moneda")
+    return st.selectbox(
+        "💱 Moneda de visualización",
+        options=monedas_disponibles(),
+        format_func=lambda m: f"{m} ({simbolo(m).strip()})",
+        key="moneda_vista",
     )
 
-    import plotly.express as px
-    fig = px.pie(resumen_cat, names="Categoria", values="Monto")
-    st.plotly_chart(fig, use_container_width=True)
-# ===== FIN DASHBOARD =====
-df = leer_df()
-df_filtrado = df.copy()
 
-if df.empty:
-    st.info("Aún no hay gastos guardados.")
-else:
-    st.sidebar.subheader("🏷 Categorías")
+@st.fragment
+def seccion_categorias():
+    contar("categorias")
+    st.subheader("🏷 Categorías")
 
-categorias = cargar_categorias()
+    usuario = usuario_actual()
+    categorias = cargar_categorias(usuario)
 
-nueva_cat = st.sidebar.text_input(
-    "Agregar nueva categoría", placeholder="Ej: Deudas, Suscripciones...")
-if st.sidebar.button("➕ Guardar categoría"):
-    nueva_cat = nueva_cat.strip()
-    if not nueva_cat:
-        st.sidebar.warning("Escribe un nombre.")
-    else:
-        # Normaliza: primera letra mayúscula, resto igual
-        nueva_cat = nueva_cat[0].upper() + nueva_cat[1:]
-        categorias = sorted(set(categorias + [nueva_cat]))
-        guardar_categorias(categorias)
-        st.sidebar.success(f"Guardada: {nueva_cat}")
-        st.rerun()
+    nueva_cat = st.text_input(
+        "Agregar nueva categoría", placeholder="Ej: Deudas, Suscripciones...")
+    if st.button("➕ Guardar categoría"):
+        nueva_cat = nueva_cat.strip()
+        if not nueva_cat:
+            st.warning("Escribe un nombre.")
+        else:
+            # Normaliza: primera letra mayúscula, resto igual
+            nueva_cat = nueva_cat[0].upper() + nueva_cat[1:]
+            categorias = sorted(set(categorias + [nueva_cat]))
+            guardar_categorias(categorias, usuario)
+            st.success(f"Guardada: {nueva_cat}")
+            # El filtro del dashboard depende de las categorías
+            st.rerun(scope="app")
+
+    st.caption(f"Total categorías: {len(categorias)}")
+
+
+@st.fragment
+def seccion_respaldos():
+    contar("respaldos")
+    st.subheader("🛟 Respaldos")
+
+    usuario = usuario_actual()
+    r = rutas(usuario)
+    ids = respaldo.ids_snapshots(r["respaldo"])
+    if not ids:
+        st.caption("Aún no hay respaldos.")
+        return
+
+    snapshot_id = st.selectbox(
+        "Volver al estado de",
+        options=list(reversed(ids)),
+        format_func=lambda i: respaldo.fecha_snapshot(i).strftime("%Y-%m-%d %H:%M:%S"),
+        key="snapshot_restaurar",
+    )
+    if st.button("♻️ Restaurar respaldo"):
+        # El estado actual también queda respaldado, por si acaso
+        respaldo.respaldar(archivos_ledger(usuario), motivo="antes_de_restaurar",
+                           base_dir=r["base"], respaldo_dir=r["respaldo"])
+        restaurar_ledger(snapshot_id, usuario)
+        st.success("✅ Ledger restaurado.")
+        st.rerun(scope="app")
+
+    st.caption(f"Respaldos guardados: {len(ids)}")
+
+
+@st.fragment
+def seccion_limites():
+    contar("limites")
+    st.subheader("🎯 Presupuestos mensuales")
+
+    usuario = usuario_actual()
+    ruta_limites = rutas(usuario)["presupuestos"]
+    limites = presupuestos.cargar_presupuestos(ruta_limites)
+    cat = st.selectbox("Categoría", options=cargar_categorias(usuario), key="cat_limite")
+    limite = st.number_input(
+        "Límite mensual (0 = sin límite)",
+        min_value=0.0,
+        value=float(limites.get(cat, 0.0)),
+        step=10.0,
+        key=f"limite_{cat}",
+    )
+    if st.button("💾 Guardar límite"):
+        limites[cat] = limite
+        presupuestos.guardar_presupuestos(limites, ruta_limites)
+        st.rerun(scope="app")
+
+
+def seccion_presupuestos():
+    # Barras desde los contadores: no recorre el ledger
+    contar("presupuestos")
+    usuario = usuario_actual()
+    r = rutas(usuario)
+    limites = presupuestos.cargar_presupuestos(r["presupuestos"])
+    if not limites:
+        return
+
+    st.subheader("🎯 Presupuesto del mes")
+    contadores = presupuestos.sincronizar(
+        firma_presupuestos(usuario), lambda: leer_df(usuario=usuario), r["contadores"])
+    mes = date.today().strftime("%Y-%m")
+    for fila in presupuestos.estado_mes(contadores, mes, limites):
+        icono = "🚨" if fila["porcentaje"] >= 1 else "⚠️" if fila["porcentaje"] >= 0.8 else "✅"
+        st.progress(
+            min(fila["porcentaje"], 1.0),
+            text=(
+                f"{icono} {fila['Categoria']}: {fmt(fila['gastado'], SIMBOLO, DECIMALES)}"
+                f" / {fmt(fila['limite'], SIMBOLO, DECIMALES)}"
+            ),
+        )
 
-st.sidebar.caption(f"Total categorías: {len(categorias)}")
 
-st.divider()
-st.subheader("📊 Dashboard")
-# ---- Defaults para que nunca explote ----
-total_hoy = total_sem = total_mes = 0.0
-df_hoy = df_sem = df_mes = pd.DataFrame()
+def seccion_pronostico():
+    contar("pronostico")
+    cache = pronostico_cacheado(usuario_actual())
 
-if df.empty:
-    st.info("Aún no hay gastos guardados.")
-else:
+    proyeccion = pronostico.pronosticar(cache["modelo"])
+    st.subheader("🔮 Proyección a fin de mes")
+    if proyeccion.empty:
+        st.info("Aún no hay gastos este mes.")
+    else:
+        tabla = proyeccion.copy()
+        for col in ("Gastado", "Proyeccion"):
+            tabla[col] = tabla[col].apply(lambda x: fmt(float(x), SIMBOLO, DECIMALES))
+        st.dataframe(tabla.rename(columns={"Proyeccion": "Proyección"}),
+                     use_container_width=True, hide_index=True)
 
+    anomalias = cache["anomalias"]
+    if not anomalias.empty:
+        st.caption("🔎 Gastos fuera de lo normal para su categoría")
+        st.dataframe(anomalias, use_container_width=True, hide_index=True)
+
+
+@st.fragment
+def seccion_limpieza():
     # === LIMPIEZA DE DATOS ===
+    contar("limpieza")
     st.subheader("🧹 Limpieza")
 
-colA, colB = st.columns(2)
+    usuario = usuario_actual()
+    colA, colB = st.columns(2)
+
+    with colA:
+        if st.button("🗑️ Eliminar último gasto", key="btn_del_ultimo"):
+            df_all = leer_df(usuario=usuario)
+            if df_all.empty:
+                st.info("No hay nada para borrar.")
+            else:
+                ultimo = df_all.tail(1)
+                df_all = df_all.iloc[:-1]
+                contadores_path = rutas(usuario)["contadores"]
+                presupuestos.sincronizar(
+                    firma_presupuestos(usuario), lambda: leer_df(usuario=usuario), contadores_path)
+                guardar_df(df_all, motivo="eliminar_ultimo", usuario=usuario)
+                fila = ultimo.iloc[0]
+                presupuestos.revertir_gasto(
+                    fila["Fecha"], fila["Categoria"], fila["Monto"], firma_presupuestos(usuario),
+                    ruta=contadores_path, moneda=fila["Moneda"])
+                st.success("✅ Último gasto eliminado.")
+                st.dataframe(ultimo, use_container_width=True)
+                st.rerun(scope="app")
+
+    with colB:
+        if st.button("🧽 Eliminar duplicados exactos", key="btn_del_dups"):
+            df_all = leer_df(usuario=usuario)
+            antes = len(df_all)
+            df_all = df_all.drop_duplicates()
+            despues = len(df_all)
+            guardar_df(df_all, motivo="eliminar_duplicados", usuario=usuario)
+            st.success(f"✅ Duplicados eliminados: {antes - despues}")
+            st.rerun(scope="app")
+
+
+@st.fragment
+def seccion_metricas(total_hoy: float, total_sem: float, total_mes: float, simb: str):
+    # Solo depende del radio "Periodo" y de los totales ya calculados
+    contar("metricas")
+    periodo = st.radio(
+        "Periodo",
+        ["Día", "Semana", "Mes"],
+        horizontal=True,
+        key="periodo_dashboard"
+    )
 
-with colA:
-    if st.button("🗑️ Eliminar último gasto", key="btn_del_ultimo"):
-        df_all = leer_df()
-        if df_all.empty:
-            st.info("No hay nada para borrar.")
-        else:
-            ultimo = df_all.tail(1)
-            df_all = df_all.iloc[:-1]
-            df_all.to_csv(CSV_PATH, index=False)
-            st.success("✅ Último gasto eliminado.")
-            st.dataframe(ultimo, use_container_width=True)
-            st.rerun()
+    if periodo == "Día":
+        total_grande = total_hoy
+        titulo = "Total de HOY"
+    elif periodo == "Semana":
+        total_grande = total_sem
+        titulo = "Total de ESTA SEMANA"
+    else:
+        total_grande = total_mes
+        titulo = "Total de ESTE MES"
+
+    st.markdown(
+        f"""
+        <div style="padding:14px;border-radius:12px;background:rgba(255,255,255,0.04);">
+            <div style="font-size:14px;opacity:0.8;">{titulo}</div>
+            <div style="font-size:46px;font-weight:800;line-height:1.1;">
+                {fmt(float(total_grande), simb, DECIMALES)}
+            </div>
+        </div>
+        """,
+        unsafe_allow_html=True
+    )
 
-with colB:
-    if st.button("🧽 Eliminar duplicados exactos", key="btn_del_dups"):
-        df_all = leer_df()
-        antes = len(df_all)
-        df_all = df_all.drop_duplicates()
-        despues = len(df_all)
-        df_all.to_csv(CSV_PATH, index=False)
-        st.success(f"✅ Duplicados eliminados: {antes - despues}")
-        st.rerun()
+    # --- Totales (según filtros) ---
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Hoy", fmt(total_hoy, simb, DECIMALES))
+    c2.metric("Semana", fmt(total_sem, simb, DECIMALES))
+    c3.metric("Mes", fmt(total_mes, simb, DECIMALES))
 
-st.divider()
 
-# Moneda fija (sin selector)
-simbolo = "$"
-decimales = 2
+@st.fragment
+def seccion_tendencia(usuario: str | None, version: tuple, fecha_ini: date, fecha_fin: date,
+                      cats_sel: tuple, moneda: str):
+    contar("tendencia")
+    st.subheader("📈 Gasto en el tiempo (según filtros)")
 
-# --- Totales (Día / Semana / Mes) ---
+    opcion = st.radio(
+        "Granularidad",
+        ["Auto", *series.GRANULARIDADES],
+        horizontal=True,
+        key="granularidad_tendencia",
+    )
+    granularidad = series.granularidad_para(fecha_ini, fecha_fin) if opcion == "Auto" else opcion
+
+    precalculadas = _series_cache(usuario, version, fecha_ini, fecha_fin, cats_sel, moneda)
+    datos = series.serie_para_grafico(precalculadas, granularidad)
+    if datos.empty:
+        st.info("No hay movimientos para graficar.")
+        return
+
+    fig = px.line(datos, x="Fecha", y="Monto", markers=len(datos) <= 60)
+    st.plotly_chart(fig, use_container_width=True, key="linea_tendencia")
+    st.caption(f"Por {granularidad.lower()} · {len(datos)} puntos · {moneda}")
+
+
+@st.fragment
+def seccion_dashboard(moneda: str):
+    contar("dashboard")
+    usuario = usuario_actual()
+    version = version_ledger(usuario)
+
+    # --- Filtros ---
+    min_fecha, max_fecha = _rango_cache(usuario, version)
+
+    rango = st.date_input(
+        "Rango de fechas",
+        value=(min_fecha, max_fecha),
+        min_value=min_fecha,
+        max_value=max_fecha,
+        key="rango_dashboard",
+    )
+    if isinstance(rango, tuple) and len(rango) == 2:
+        fecha_ini, fecha_fin = rango
+    else:
+        fecha_ini, fecha_fin = min_fecha, max_fecha
 
+    categorias = cargar_categorias(usuario)
+    cats_sel = st.multiselect(
+        "Filtrar categorías",
+        options=categorias,
+        default=categorias,
+        key="cats_dashboard",
+    )
 
-# --- Filtros ---
+    # Con el backend particionado/parquet solo se leen los meses del rango
+    df_filtrado, (total_hoy, total_sem, total_mes) = _filtrar_cache(
+        usuario, version, fecha_ini, fecha_fin, tuple(cats_sel), moneda)
 
-df["Fecha"] = pd.to_datetime(df["Fecha"], errors="coerce").dt.date
-df["Monto"] = pd.to_numeric(df["Monto"], errors="coerce").fillna(0.0)
-df = df.dropna(subset=["Fecha"])
+    seccion_metricas(total_hoy, total_sem, total_mes, simbolo(moneda))
 
-min_fecha = df["Fecha"].min()
-max_fecha = df["Fecha"].max()
+    # --- Pie por categoría ---
+    st.subheader("🧩 Distribución por categoría (según filtros)")
 
-rango = st.date_input(
-    "Rango de fechas",
-    value=(min_fecha, max_fecha),
-    min_value=min_fecha,
-    max_value=max_fecha,
-    key="rango_dashboard",
-)
-if isinstance(rango, tuple) and len(rango) == 2:
-    fecha_ini, fecha_fin = rango
-else:
-    fecha_ini, fecha_fin = min_fecha, max_fecha
-
-categorias = cargar_categorias()
-cats_sel = st.multiselect(
-    "Filtrar categorías",
-    options=categorias,
-    default=categorias,
-    key="cats_dashboard",
-)
+    if df_filtrado.empty:
+        st.warning("No hay datos con esos filtros.")
+    else:
+        por_cat = (
+            df_filtrado.groupby("Categoria")["Monto"]
+            .sum()
+            .sort_values(ascending=False)
+            .reset_index()
+        )
 
-df_filtrado = df[
-    (df["Fecha"] >= fecha_ini) &
-    (df["Fecha"] <= fecha_fin) &
-    (df["Categoria"].isin(cats_sel))
-].copy()
-total_hoy, total_sem, total_mes, df_hoy, df_sem, df_mes = totales_por_periodo(
-    df_filtrado)
-periodo = st.radio(
-    "Periodo",
-    ["Día", "Semana", "Mes"],
-    horizontal=True,
-    key="periodo_dashboard"
-)
+        fig = px.pie(por_cat, names="Categoria", values="Monto")
+        st.plotly_chart(fig, use_container_width=True, key="pie_categoria")
 
-if periodo == "Día":
-    total_grande = total_hoy
-    titulo = "Total de HOY"
-elif periodo == "Semana":
-    total_grande = total_sem
-    titulo = "Total de ESTA SEMANA"
-else:
-    total_grande = total_mes
-    titulo = "Total de ESTE MES"
-
-simbolo = locals().get("simbolo", "$")
-decimales = locals().get("decimales", 2)
-
-st.markdown(
-    f"""
-    <div style="padding:14px;border-radius:12px;background:rgba(255,255,255,0.04);">
-        <div style="font-size:14px;opacity:0.8;">{titulo}</div>
-        <div style="font-size:46px;font-weight:800;line-height:1.1;">
-            {fmt(float(total_grande), str(simbolo), int(decimales))}
-        </div>
-    </div>
-    """,
-    unsafe_allow_html=True
-)
+        por_cat["Monto"] = por_cat["Monto"].apply(
+            lambda x: fmt(float(x), simbolo(moneda), DECIMALES))
+        st.dataframe(por_cat.rename(
+            columns={"Monto": "Total"}), use_container_width=True)
 
-# --- Totales (según filtros) ---
+    seccion_tendencia(usuario, version, fecha_ini, fecha_fin, tuple(cats_sel), moneda)
 
-c1, c2, c3 = st.columns(3)
-c1.metric("Hoy", fmt(total_hoy, simbolo, decimales))
-c2.metric("Semana", fmt(total_sem, simbolo, decimales))
-c3.metric("Mes", fmt(total_mes, simbolo, decimales))
+    # ----------------------------
+    # Movimientos (según filtros)
+    # ----------------------------
+    st.subheader("🗓️ Movimientos (según filtros)")
+    if df_filtrado.empty:
+        st.info("No hay movimientos para mostrar.")
+    else:
+        st.dataframe(df_filtrado.sort_values(by="Fecha", ascending=False),
+                     use_container_width=True)
 
-# --- Pie por categoría ---
-st.subheader("🧩 Distribución por categoría (según filtros)")
 
-if df_filtrado.empty:
-    st.warning("No hay datos con esos filtros.")
-else:
-    por_cat = (
-        df_filtrado  .groupby("Categoria")["Monto"]
-        .sum()
-        .sort_values(ascending=False)
-        .reset_index()
-    )
+# UI
+st.set_page_config(page_title="Control Financiero IA", layout="centered")
+st.title("💸 Control Financiero con IA")
+contar("app")
 
-    fig = px.pie(por_cat, names="Categoria", values="Monto")
-    st.plotly_chart(fig, use_container_width=True, key="pie_categoria")
+with st.sidebar:
+    usuario = seccion_usuario()
 
-    por_cat["Monto"] = por_cat["Monto"].apply(
-        lambda x: fmt(float(x), simbolo, decimales))
-    st.dataframe(por_cat.rename(
-        columns={"Monto": "Total"}), use_container_width=True)
+crear_archivo(usuario)
+respaldo.respaldo_programado(archivos_ledger(usuario), base_dir=rutas(usuario)["base"],
+                             respaldo_dir=rutas(usuario)["respaldo"])
 
-    # ----------------------------
-    # Movimientos (según filtros)
-    # ----------------------------
-st.subheader("🗓️ Movimientos (según filtros)")
-if df_filtrado.empty:
-    st.info("No hay movimientos para mostrar.")
+if not API_KEY:
+    st.error("❌ No se encontró OPENAI_API_KEY en .env. Agrega tu key y recarga.")
+    st.stop()
+
+with st.sidebar:
+    moneda = seccion_moneda()
+
+seccion_clasificacion()
+seccion_historial()
+
+vacio = _vacio_cache(usuario, version_ledger(usuario))
+seccion_resumen(vacio, moneda)
+
+with st.sidebar:
+    seccion_categorias()
+    seccion_limites()
+    seccion_respaldos()
+
+st.divider()
+st.subheader("📊 Dashboard")
+
+if vacio:
+    st.info("Aún no hay gastos guardados.")
 else:
-    st.dataframe(df_filtrado.sort_values(by="Fecha", ascending=False),
-                 use_container_width=True)
+    seccion_limpieza()
+    st.divider()
+    seccion_presupuestos()
+    seccion_pronostico()
+    seccion_dashboard(moneda)
+
+with st.sidebar.expander("🔧 Ejecuciones por sección"):
+    st.json(st.session_state.get("_contadores", {}))
+    st.caption("Caché compartido (todos los usuarios)")
+    st.json(cache_usuarios.estadisticas())
@@ -0,0 +1,104 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+# Memoria total (aprox.) para ledgers y rollups cargados, entre todos los usuarios
+MEMORIA_MB = float(os.getenv("CACHE_MEMORIA_MB", "256"))
+# Filas que se miden para estimar el tamaño de un DataFrame grande
+MUESTRA_FILAS = 10_000
+
+
+# ----------------------------
+# Tamaño de lo guardado
+# ----------------------------
+def _muestra(valor):
+    """(filas tomadas cada k, factor): medir deep=True un ledger entero es O(filas)."""
+    if len(valor) <= MUESTRA_FILAS:
+        return valor, 1.0
+    muestra = valor.iloc[::len(valor) // MUESTRA_FILAS]
+    return muestra, len(valor) / len(muestra)
+
+
+def tamano(valor) -> int:
+    """Bytes aproximados de un valor cacheado (DataFrames con deep=True, por muestra)."""
+    if isinstance(valor, pd.DataFrame):
+        muestra, factor = _muestra(valor)
+        return int(muestra.memory_usage(index=True, deep=True).sum() * factor)
+    if isinstance(valor, pd.Series):
+        muestra, factor = _muestra(valor)
+        return int(muestra.memory_usage(index=True, deep=True) * factor)
+    if isinstance(valor, dict):
+        return sys.getsizeof(valor) + sum(tamano(k) + tamano(v) for k, v in valor.items())
+    if isinstance(valor, (list, tuple, set)):
+        return sys.getsizeof(valor) + sum(tamano(v) for v in valor)
+    return sys.getsizeof(valor)
+
+
+# ----------------------------
+# LRU compartido por todo el proceso
+# ----------------------------
+# (usuario, clave) -> {"version", "valor", "bytes"}; el más viejo primero
+_entradas = OrderedDict()
+_lock = threading.Lock()
+_stats = {"bytes": 0, "aciertos": 0, "fallos": 0, "desalojos": 0}
+
+
+def _limite_bytes() -> int:
+    return int(MEMORIA_MB * 1024 * 1024)
+
+
+def _sacar(llave) -> dict:
+    entrada = _entradas.pop(llave)
+    _stats["bytes"] -= entrada["bytes"]
+    return entrada
+
+
+def obtener(usuario, clave: tuple, version, calcular, incremental: bool = False):
+    """
+    Valor cacheado de `clave` para `usuario` mientras `version` no cambie.
+    Si cambió (o no está), se llama a calcular() y se guarda, desalojando
+    lo menos usado hasta entrar en MEMORIA_MB. Con incremental=True se
+    llama calcular(anterior) con el valor viejo (o None) para actualizarlo
+    en vez de rehacerlo.
+
+    Lo devuelto se comparte entre sesiones: no modificarlo.
+    """
+    llave = (usuario, clave)
+    with _lock:
+        entrada = _entradas.get(llave)
+        if entrada is not None and entrada["version"] == version:
+            _entradas.move_to_end(llave)
+            _stats["aciertos"] += 1
+            return entrada["valor"]
+        _stats["fallos"] += 1
+        anterior = entrada["valor"] if entrada is not None else None
+
+    # Fuera del lock: leer un ledger no bloquea a los demás usuarios
+    valor = calcular(anterior) if incremental else calcular()
+    bytes_valor = tamano(valor)
+
+    with _lock:
+        if llave in _entradas:
+            _sacar(llave)
+        if bytes_valor > _limite_bytes():
+            # Más grande que todo el presupuesto: se devuelve sin guardar
+            return valor
+        _entradas[llave] = {"version": version, "valor": valor, "bytes": bytes_valor}
+        _stats["bytes"] += bytes_valor
+        while _stats["bytes"] > _limite_bytes():
+            _sacar(next(iter(_entradas)))
+            _stats["desalojos"] += 1
+    return valor
+
+
+def estadisticas() -> dict:
+    with _lock:
+        return {
+            **_stats,
+            "entradas": len(_entradas),
+            "usuarios": len({usuario for usuario, _ in _entradas}),
+            "limite_bytes": _limite_bytes(),
+        }
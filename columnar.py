@@ -0,0 +1,230 @@
+import csv
+import os
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+
+from monedas import COLUMNAS, MONEDA_BASE
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    DISPONIBLE = True
+except ImportError:  # pyarrow es opcional: sin él la app sigue con gastos.csv
+    pa = pq = None
+    DISPONIBLE = False
+
+PARQUET = "gastos.parquet"
+DELTA = "delta.csv"
+
+# Filas en delta.csv antes de compactarlas dentro del parquet
+UMBRAL_COMPACTAR = 500
+# Row groups chicos para que el filtro por Fecha pueda saltarse bloques
+FILAS_POR_GRUPO = 64_000
+
+
+def _esquema():
+    return pa.schema([
+        ("Fecha", pa.date32()),
+        ("Monto", pa.float64()),
+        ("Categoria", pa.string()),
+        ("Descripcion", pa.string()),
+        ("Moneda", pa.string()),
+    ])
+
+
+def _requiere_pyarrow():
+    if not DISPONIBLE:
+        raise RuntimeError("El backend parquet necesita pyarrow (pip install pyarrow)")
+
+
+def _tipar(df: pd.DataFrame) -> pd.DataFrame:
+    """Deja el DataFrame con los tipos del esquema (Fecha como date)."""
+    df = df.copy()
+    for col in COLUMNAS:
+        if col not in df.columns:
+            df[col] = None
+    df["Fecha"] = pd.to_datetime(df["Fecha"], errors="coerce").dt.date
+    df["Monto"] = pd.to_numeric(df["Monto"], errors="coerce").fillna(0.0)
+    df["Categoria"] = df["Categoria"].astype("string").fillna("Otros")
+    df["Descripcion"] = df["Descripcion"].astype("string").fillna("")
+    df["Moneda"] = df["Moneda"].astype("string").fillna(MONEDA_BASE)
+    return df.dropna(subset=["Fecha"])[COLUMNAS]
+
+
+def existe(ledger_dir) -> bool:
+    return (Path(ledger_dir) / PARQUET).exists()
+
+
+# ----------------------------
+# Escritura
+# ----------------------------
+def _escribir_parquet(ledger_dir: Path, df: pd.DataFrame) -> None:
+    _requiere_pyarrow()
+    ledger_dir.mkdir(parents=True, exist_ok=True)
+    tabla = pa.Table.from_pandas(_tipar(df), schema=_esquema(), preserve_index=False)
+    tmp = ledger_dir / (PARQUET + ".tmp")
+    pq.write_table(tabla, tmp, row_group_size=FILAS_POR_GRUPO)
+    os.replace(tmp, ledger_dir / PARQUET)
+
+
+def reescribir_df(ledger_dir, df: pd.DataFrame) -> None:
+    """Reescribe el parquet completo y vacía el delta (eliminar/deduplicar)."""
+    ledger_dir = Path(ledger_dir)
+    _escribir_parquet(ledger_dir, df)
+    (ledger_dir / DELTA).unlink(missing_ok=True)
+
+
+def importar_csv(csv_path, ledger_dir) -> None:
+    """gastos.csv -> gastos.parquet"""
+    csv_path = Path(csv_path)
+    if csv_path.exists():
+        df = pd.read_csv(csv_path)
+    else:
+        df = pd.DataFrame(columns=COLUMNAS)
+    reescribir_df(ledger_dir, df)
+
+
+def exportar_csv(ledger_dir, csv_path) -> None:
+    """gastos.parquet (+ delta) -> CSV con el formato de gastos.csv"""
+    leer(ledger_dir).to_csv(csv_path, index=False)
+
+
+def _filas_delta(ledger_dir: Path) -> int:
+    ruta = ledger_dir / DELTA
+    if not ruta.exists():
+        return 0
+    with open(ruta, mode="rb") as file:
+        return max(sum(1 for _ in file) - 1, 0)
+
+
+def _delta_sin_moneda(ruta: Path) -> bool:
+    if not ruta.exists():
+        return False
+    with open(ruta, mode="r", newline="", encoding="utf-8") as file:
+        return "Moneda" not in next(csv.reader(file), ["Moneda"])
+
+
+def agregar_filas(ledger_dir, filas: list[dict]) -> None:
+    """
+    Agrega al delta.csv (append barato). Cuando el delta pasa
+    UMBRAL_COMPACTAR filas se compacta dentro del parquet.
+    """
+    ledger_dir = Path(ledger_dir)
+    ledger_dir.mkdir(parents=True, exist_ok=True)
+    ruta = ledger_dir / DELTA
+    if _delta_sin_moneda(ruta):
+        # Delta de antes de la columna Moneda: se compacta con el esquema nuevo
+        compactar(ledger_dir)
+    nueva = not ruta.exists()
+    with open(ruta, mode="a", newline="", encoding="utf-8") as file:
+        writer = csv.DictWriter(file, fieldnames=COLUMNAS, extrasaction="ignore")
+        if nueva:
+            writer.writeheader()
+        writer.writerows(filas)
+
+    if _filas_delta(ledger_dir) >= UMBRAL_COMPACTAR:
+        compactar(ledger_dir)
+
+
+def agregar_fila(ledger_dir, fila: dict) -> None:
+    agregar_filas(ledger_dir, [fila])
+
+
+def compactar(ledger_dir) -> None:
+    """Junta parquet + delta en un parquet nuevo y borra el delta."""
+    ledger_dir = Path(ledger_dir)
+    if not (ledger_dir / DELTA).exists():
+        return
+    reescribir_df(ledger_dir, leer(ledger_dir))
+
+
+# ----------------------------
+# Lectura
+# ----------------------------
+def _leer_delta(ledger_dir: Path) -> pd.DataFrame:
+    ruta = ledger_dir / DELTA
+    if not ruta.exists():
+        return pd.DataFrame(columns=COLUMNAS)
+    return _tipar(pd.read_csv(ruta))
+
+
+def leer(ledger_dir, columnas: list[str] | None = None,
+         fecha_ini: date | None = None, fecha_fin: date | None = None) -> pd.DataFrame:
+    """
+    Lee el ledger columnar.
+    - columnas: proyección (ej. ["Categoria", "Monto"] para el pie)
+    - fecha_ini / fecha_fin: se empujan al lector de parquet, que usa las
+      estadísticas min/max de cada row group para no leer bloques de más.
+    """
+    _requiere_pyarrow()
+    ledger_dir = Path(ledger_dir)
+    columnas = list(columnas) if columnas else list(COLUMNAS)
+
+    filtros = []
+    if fecha_ini is not None:
+        filtros.append(("Fecha", ">=", fecha_ini))
+    if fecha_fin is not None:
+        filtros.append(("Fecha", "<=", fecha_fin))
+
+    if existe(ledger_dir):
+        # Parquets de antes de la columna Moneda: se proyecta lo que existe
+        presentes = pq.read_schema(ledger_dir / PARQUET).names
+        tabla = pq.read_table(
+            ledger_dir / PARQUET,
+            columns=[c for c in columnas if c in presentes],
+            filters=filtros or None,
+            memory_map=True,
+        )
+        df = tabla.to_pandas()
+        if "Moneda" in columnas and "Moneda" not in presentes:
+            df["Moneda"] = MONEDA_BASE
+        df = df[columnas]
+    else:
+        df = pd.DataFrame(columns=columnas)
+
+    delta = _leer_delta(ledger_dir)
+    if not delta.empty:
+        if fecha_ini is not None:
+            delta = delta[delta["Fecha"] >= fecha_ini]
+        if fecha_fin is not None:
+            delta = delta[delta["Fecha"] <= fecha_fin]
+        partes = [df, delta[columnas]] if not df.empty else [delta[columnas]]
+        df = pd.concat(partes, ignore_index=True)
+
+    return df
+
+
+def num_filas(ledger_dir) -> int:
+    """Filas totales usando solo la metadata del parquet + el delta."""
+    ledger_dir = Path(ledger_dir)
+    filas = _filas_delta(ledger_dir)
+    if existe(ledger_dir):
+        filas += pq.ParquetFile(ledger_dir / PARQUET).metadata.num_rows
+    return filas
+
+
+def rango_fechas(ledger_dir) -> tuple[date, date] | None:
+    """(min, max) de Fecha desde las estadísticas de los row groups + delta."""
+    _requiere_pyarrow()
+    ledger_dir = Path(ledger_dir)
+    minimos, maximos = [], []
+
+    if existe(ledger_dir):
+        meta = pq.ParquetFile(ledger_dir / PARQUET).metadata
+        idx = COLUMNAS.index("Fecha")
+        for i in range(meta.num_row_groups):
+            stats = meta.row_group(i).column(idx).statistics
+            if stats is not None and stats.has_min_max:
+                minimos.append(stats.min)
+                maximos.append(stats.max)
+
+    delta = _leer_delta(ledger_dir)
+    if not delta.empty:
+        minimos.append(delta["Fecha"].min())
+        maximos.append(delta["Fecha"].max())
+
+    if not minimos:
+        return None
+    return min(minimos), max(maximos)
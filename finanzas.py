@@ -1,16 +1,25 @@
-import csv
-import os
+import argparse
 from datetime import datetime
 
-ARCHIVO = "gastos.csv"
-
-
-# Crear archivo si no existe
-def crear_archivo():
-    if not os.path.exists(ARCHIVO):
-        with open(ARCHIVO, mode="w", newline="") as file:
-            writer = csv.writer(file)
-            writer.writerow(["Fecha", "Monto", "Categoria", "Descripcion"])
+from monedas import MONEDA_BASE, detectar_moneda, simbolo
+from nucleo import (
+    COLUMNAS,
+    normalizar_monto,
+    crear_archivo,
+    origen_reportes,
+    guardar_gasto,
+    leer_df,
+    normalizar_usuario,
+    pronostico_cacheado,
+    resumen_por_categoria,
+    rutas,
+    totales_por_periodo,
+)
+from reportes import generar_reportes
+
+# Usuario del ledger (--usuario); None = ledger compartido
+USUARIO = None
+SIMBOLO = simbolo(MONEDA_BASE)
 
 
 # Agregar gasto
@@ -19,88 +28,97 @@ def agregar_gasto():
     categoria = input("Categoria: ")
     descripcion = input("Descripcion: ")
 
-    fecha = datetime.now().strftime("%Y-%m-%d")
-
-    with open(ARCHIVO, mode="a", newline="") as file:
-        writer = csv.writer(file)
-        writer.writerow([fecha, monto, categoria, descripcion])
+    # "12 €" -> 12.0 EUR; sin moneda, la base
+    guardar_gasto({
+        "Monto": normalizar_monto(monto), "Categoria": categoria.strip() or "Otros",
+        "Descripcion": descripcion, "Moneda": detectar_moneda(monto)}, usuario=USUARIO)
 
     print("✅ Gasto guardado\n")
 
 
 # Ver total gastos
 def ver_total():
-    total = 0
+    total = resumen_por_categoria(usuario=USUARIO)["Monto"].sum()
 
-    with open(ARCHIVO, mode="r") as file:
-        reader = csv.DictReader(file)
-        for fila in reader:
-            total += float(fila["Monto"])
-
-    print(f"💰 Total gastado: ${total}\n")
+    print(f"💰 Total gastado: {SIMBOLO}{total:.2f}\n")
 
 
 # Ver total por categoria
 def ver_por_categoria():
-    resumen = {}
-
-    with open(ARCHIVO, mode="r") as file:
-        reader = csv.DictReader(file)
-        for fila in reader:
-            categoria = fila["Categoria"]
-            monto = float(fila["Monto"])
-
-            if categoria in resumen:
-                resumen[categoria] += monto
-            else:
-                resumen[categoria] = monto
+    resumen = resumen_por_categoria(usuario=USUARIO)
 
     print("\n📊 Gastos por categoria:")
-    for categoria, total in resumen.items():
-        print(f"{categoria}: ${total}")
+    for _, fila in resumen.iterrows():
+        print(f"{fila['Categoria']}: {SIMBOLO}{fila['Monto']:.2f}")
     print()
 
 
 # Ver total del mes actual
 def ver_mes_actual():
-    mes_actual = datetime.now().strftime("%Y-%m")
-    total = 0
+    inicio_mes = datetime.now().date().replace(day=1)
+    _, _, total, *_ = totales_por_periodo(leer_df(inicio_mes, usuario=USUARIO), MONEDA_BASE)
 
-    with open(ARCHIVO, mode="r") as file:
-        reader = csv.DictReader(file)
-        for fila in reader:
-            if fila["Fecha"].startswith(mes_actual):
-                total += float(fila["Monto"])
-
-    print(f"\n📅 Total gastado este mes: ${total}\n")
+    print(f"\n📅 Total gastado este mes: {SIMBOLO}{total:.2f}\n")
 
 
 # NUEVO — Exportar reporte mensual
 def exportar_reporte_mes():
     mes_actual = datetime.now().strftime("%Y-%m")
-    nombre_reporte = f"reporte_{mes_actual}.csv"
+    # Junto al ledger del usuario, no en el directorio de trabajo
+    nombre_reporte = rutas(USUARIO)["base"] / f"reporte_{mes_actual}.csv"
 
-    with open(ARCHIVO, mode="r") as file:
-        reader = csv.DictReader(file)
-        filas_mes = [
-            fila for fila in reader if fila["Fecha"].startswith(mes_actual)]
+    filas_mes = leer_df(datetime.now().date().replace(day=1), usuario=USUARIO)
 
-    if not filas_mes:
+    if filas_mes.empty:
         print("⚠️ No hay gastos este mes\n")
         return
 
-    with open(nombre_reporte, mode="w", newline="") as file:
-        writer = csv.DictWriter(
-            file, fieldnames=["Fecha", "Monto", "Categoria", "Descripcion"])
-        writer.writeheader()
-        writer.writerows(filas_mes)
+    filas_mes[COLUMNAS].to_csv(nombre_reporte, index=False)
 
     print(f"📁 Reporte creado: {nombre_reporte}\n")
 
 
+# Generar reportes de todos los meses (CSV por categoria + resumen JSON)
+def generar_reportes_todos():
+    solo_cambios = input("¿Solo meses con cambios? (s/n): ").strip().lower() == "s"
+
+    inicio = datetime.now()
+    resultado = generar_reportes(origen_reportes(USUARIO),
+                                 destino=rutas(USUARIO)["reportes"],
+                                 solo_cambios=solo_cambios)
+    segundos = (datetime.now() - inicio).total_seconds()
+
+    print(f"📁 Meses generados: {len(resultado['generados'])}")
+    print(f"⏭️ Meses sin cambios: {len(resultado['omitidos'])}")
+    print(f"⏱️ Tiempo: {segundos:.2f}s\n")
+
+
+# Pronostico de fin de mes + gastos raros
+def ver_pronostico():
+    from pronostico import pronosticar
+
+    # Caché del proceso: dentro del mismo menú, las consultas siguientes
+    # solo reajustan con las filas nuevas. La primera de cada corrida
+    # lee el ledger completo y ajusta desde cero.
+    cache = pronostico_cacheado(USUARIO)
+    proyeccion, anomalias = pronosticar(cache["modelo"]), cache["anomalias"]
+
+    print("\n🔮 Proyeccion a fin de mes:")
+    if proyeccion.empty:
+        print("Aun no hay gastos este mes")
+    for _, fila in proyeccion.iterrows():
+        print(f"{fila['Categoria']}: {SIMBOLO}{fila['Gastado']:.2f} -> {SIMBOLO}{fila['Proyeccion']:.2f}")
+
+    if not anomalias.empty:
+        print("\n🔎 Gastos fuera de lo normal:")
+        for _, fila in anomalias.iterrows():
+            print(f"{fila['Fecha']} {fila['Categoria']}: {simbolo(fila['Moneda'])}{fila['Monto']} ({fila['Descripcion']}) z={fila['z']}")
+    print()
+
+
 # Menú principal
 def menu():
-    crear_archivo()
+    crear_archivo(USUARIO)
 
     while True:
         print("==== CONTROL FINANCIERO ====")
@@ -109,7 +127,9 @@ def menu():
         print("3 Ver total por categoria")
         print("4 Ver total del mes actual")
         print("5 Exportar reporte mensual")
-        print("6 Salir")
+        print("6 Generar reportes de todos los meses")
+        print("7 Ver pronostico del mes")
+        print("8 Salir")
 
         opcion = input("Elige una opcion: ")
 
@@ -124,10 +144,19 @@ def menu():
         elif opcion == "5":
             exportar_reporte_mes()
         elif opcion == "6":
+            generar_reportes_todos()
+        elif opcion == "7":
+            ver_pronostico()
+        elif opcion == "8":
             print("Adios 👋")
             break
         else:
             print("Opcion invalida\n")
 
 
-menu()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Control financiero (sin IA)")
+    parser.add_argument("--usuario", default="",
+                        help="Ledger de usuarios/<usuario>/ (vacío = compartido)")
+    USUARIO = normalizar_usuario(parser.parse_args().usuario)
+    menu()
@@ -1,183 +1,124 @@
-import csv
-import datetime
-import json
-import os
-import re
-from pathlib import Path
-
-from dotenv import load_dotenv
-from openai import OpenAI
+import argparse
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from nucleo import (
+    EscritorLotes,
+    api_key,
+    clasificar_cacheado,
+    clasificar_con_ia,
+    crear_archivo,
+    guardar_gasto,
+    normalizar_usuario,
+    rutas,
+)
 
 
 # ----------------------------
 # Config / Env
 # ----------------------------
-ARCHIVO = "gastos.csv"
-CATEGORIAS_VALIDAS = {"Comida", "Transporte",
-                      "Hogar", "Entretenimiento", "Salud", "Otros"}
-
-env_path = Path(__file__).with_name(".env")
-load_dotenv(env_path, override=True)
-
-API_KEY = os.getenv("OPENAI_API_KEY")
-if not API_KEY:
-    print("❌ No se encontró OPENAI_API_KEY en .env")
-    print(f"➡️ Revisa este archivo: {env_path}")
-    print('➡️ Debe verse así: OPENAI_API_KEY=sk-proj-.... (tu key real completa)')
-    raise SystemExit(1)
-
-client = OpenAI(api_key=API_KEY)
-
-
-# ----------------------------
-# Helpers
-# ----------------------------
-def crear_archivo():
-    """Crea el CSV si no existe."""
-    if not os.path.exists(ARCHIVO):
-        with open(ARCHIVO, mode="w", newline="") as file:
-            writer = csv.writer(file)
-            writer.writerow(["Fecha", "Monto", "Categoria", "Descripcion"])
-
-
-def _extraer_json(texto: str) -> str:
-    """
-    Si el modelo devuelve texto extra (ej: 'Aquí está el JSON: {...}'),
-    intenta extraer el primer objeto JSON {...}.
-    """
-    texto = texto.strip()
-
-    # Intento directo
-    if texto.startswith("{") and texto.endswith("}"):
-        return texto
-
-    # Busca el primer bloque {...} (simple pero efectivo)
-    match = re.search(r"\{.*\}", texto, flags=re.DOTALL)
-    if match:
-        return match.group(0).strip()
-
-    # Si no encontró nada, devuelve tal cual para que el parser falle y lo veamos
-    return texto
-
-
-def _normalizar_categoria(cat: str) -> str:
-    if not isinstance(cat, str):
-        return "Otros"
-    cat = cat.strip()
-    # Normalizaciones comunes
-    mapping = {
-        "Comida": "Comida",
-        "Alimentacion": "Comida",
-        "Alimentación": "Comida",
-        "Transporte": "Transporte",
-        "Hogar": "Hogar",
-        "Entretenimiento": "Entretenimiento",
-        "Salud": "Salud",
-        "Otros": "Otros",
-    }
-    # Si ya viene bien:
-    if cat in CATEGORIAS_VALIDAS:
-        return cat
-    # Si viene raro:
-    return mapping.get(cat, "Otros")
-
-
-def _normalizar_monto(monto) -> float:
-    """
-    Acepta números o strings como "45", "45.5", "$45", "45,20"
-    """
-    if isinstance(monto, (int, float)):
-        return float(monto)
-
-    if isinstance(monto, str):
-        s = monto.strip()
-        s = s.replace("$", "").replace("USD", "").strip()
-        s = s.replace(",", ".")
-        # Deja solo números y punto
-        s = re.sub(r"[^0-9.]", "", s)
-        try:
-            return float(s) if s else 0.0
-        except ValueError:
-            return 0.0
-
-    return 0.0
-
-
-# ----------------------------
-# IA / Parsing
-# ----------------------------
-def clasificar_con_ia(texto_usuario: str) -> dict:
-    """
-    Devuelve un dict con: Monto (float), Categoria (str), Descripcion (str)
-    """
-    prompt = (
-        "Extrae la siguiente información del texto y responde SOLO con JSON.\n"
-        "Campos obligatorios: Monto (numero), Categoria (string), Descripcion (string).\n"
-        f"Categorias permitidas: {', '.join(sorted(CATEGORIAS_VALIDAS))}.\n\n"
-        f"Texto: {texto_usuario}\n"
-    )
-
-    # 1) Intento “fuerte”: forzar salida JSON con response_format
-    try:
-        resp = client.chat.completions.create(
-            model="gpt-4.1-mini",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0,
-            response_format={"type": "json_object"},
-        )
-        raw = resp.choices[0].message.content
-    except Exception:
-        # 2) Plan B: sin response_format (por si tu cuenta/modelo lo rechaza)
-        resp = client.chat.completions.create(
-            model="gpt-4.1-mini",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0,
-        )
-        raw = resp.choices[0].message.content
-
-    # Parse robusto
-    raw_json = _extraer_json(raw)
-    try:
-        data = json.loads(raw_json)
-    except Exception:
-        # Si aún falla, devolvemos algo seguro para que NO se rompa la app
-        return {"Monto": 0.0, "Categoria": "Otros", "Descripcion": texto_usuario}
-
-    # Normaliza campos
-    monto = _normalizar_monto(data.get("Monto", 0))
-    categoria = _normalizar_categoria(data.get("Categoria", "Otros"))
-    descripcion = data.get("Descripcion", texto_usuario)
-
-    if not isinstance(descripcion, str) or not descripcion.strip():
-        descripcion = texto_usuario
-
-    return {"Monto": monto, "Categoria": categoria, "Descripcion": descripcion.strip()}
+def verificar_api_key():
+    if not api_key():
+        env_path = rutas()["base"] / ".env"
+        print("❌ No se encontró OPENAI_API_KEY en .env")
+        print(f"➡️ Revisa este archivo: {env_path}")
+        print('➡️ Debe verse así: OPENAI_API_KEY=sk-proj-.... (tu key real completa)')
+        raise SystemExit(1)
 
 
 # ----------------------------
 # App
 # ----------------------------
-def agregar_gasto_ia():
+def agregar_gasto_ia(usuario: str | None = None):
     texto = input("Escribe gasto (Ej: 45 McDonalds): ").strip()
     if not texto:
         print("⚠️ No ingresaste nada.\n")
         return
 
-    datos = clasificar_con_ia(texto)
-
-    fecha = datetime.datetime.now().strftime("%Y-%m-%d")
-
-    with open(ARCHIVO, mode="a", newline="") as file:
-        writer = csv.writer(file)
-        writer.writerow(
-            [fecha, datos["Monto"], datos["Categoria"], datos["Descripcion"]])
+    datos = clasificar_con_ia(texto, usuario=usuario)
+    guardar_gasto(datos, usuario=usuario)
 
     print(
-        f"🧾 Gasto guardado: {datos['Monto']} | {datos['Categoria']} | {datos['Descripcion']}\n")
+        f"🧾 Gasto guardado: {datos['Monto']} {datos['Moneda']} | {datos['Categoria']} | {datos['Descripcion']}\n")
 
 
-def menu():
-    crear_archivo()
+# ----------------------------
+# Modo batch (ingest)
+# ----------------------------
+def _lineas(origen: str):
+    """Líneas no vacías de stdin ("-") o de un archivo, sin cargarlo entero."""
+    file = sys.stdin if origen == "-" else open(origen, encoding="utf-8")
+    try:
+        for linea in file:
+            linea = linea.strip()
+            if linea:
+                yield linea
+    finally:
+        if file is not sys.stdin:
+            file.close()
+
+
+def ingest(origen: str, hilos: int = 8, lote: int = 200, usuario: str | None = None):
+    """Clasifica y guarda todos los gastos de `origen`, una línea por gasto."""
+    crear_archivo(usuario)
+    escritor = EscritorLotes(usuario, tamano=lote)
+    leidas = errores = compartidas = 0
+    inicio = time.perf_counter()
+
+    def guardar(linea, futuro):
+        nonlocal errores
+        try:
+            monto, categoria, descripcion, moneda = futuro.result()
+        except Exception as e:
+            errores += 1
+            print(f"⚠️ No se pudo clasificar {linea!r}: {e}", file=sys.stderr)
+            return
+        escritor.agregar({"Monto": monto, "Categoria": categoria,
+                          "Descripcion": descripcion, "Moneda": moneda})
+
+    with ThreadPoolExecutor(max_workers=hilos) as pool:
+        # Ventana acotada de pedidos en vuelo: no se lee todo stdin a memoria
+        pendientes = deque()
+        # texto -> pedido todavía en la ventana: las líneas repetidas lo
+        # comparten en vez de volver a llamar a la API (el lru_cache solo
+        # ve el resultado cuando el primero termina)
+        en_vuelo = {}
+
+        def siguiente():
+            linea, futuro = pendientes.popleft()
+            if en_vuelo.get(linea) is futuro:
+                del en_vuelo[linea]
+            guardar(linea, futuro)
+
+        for linea in _lineas(origen):
+            leidas += 1
+            futuro = en_vuelo.get(linea)
+            if futuro is None:
+                futuro = en_vuelo[linea] = pool.submit(clasificar_cacheado, linea, usuario=usuario)
+            else:
+                compartidas += 1
+            pendientes.append((linea, futuro))
+            if len(pendientes) >= hilos * 4:
+                siguiente()
+        while pendientes:
+            siguiente()
+
+    escritor.cerrar()
+    segundos = time.perf_counter() - inicio
+    cache = clasificar_cacheado.cache_info()
+
+    print("==== RESUMEN INGEST ====")
+    print(f"Líneas leídas: {leidas}")
+    print(f"Gastos guardados: {escritor.escritas}")
+    print(f"Errores: {errores}")
+    print(f"Aciertos de caché: {cache.hits + compartidas}")
+    print(f"Tiempo: {segundos:.2f}s ({leidas / segundos if segundos else 0:.1f} líneas/s)")
+
+
+def menu(usuario: str | None = None):
+    crear_archivo(usuario)
 
     while True:
         print("==== CONTROL FINANCIERO IA ====")
@@ -186,7 +127,7 @@ def menu():
         opcion = input("Opción: ").strip()
 
         if opcion == "1":
-            agregar_gasto_ia()
+            agregar_gasto_ia(usuario)
         elif opcion == "2":
             print("Adiós 👋")
             break
@@ -195,4 +136,22 @@ def menu():
 
 
 if __name__ == "__main__":
-    menu()
+    parser = argparse.ArgumentParser(description="Control financiero IA")
+    parser.add_argument("--usuario", default="",
+                        help="Ledger de usuarios/<usuario>/ (vacío = compartido)")
+    sub = parser.add_subparsers(dest="comando")
+    p_ingest = sub.add_parser("ingest", help="Clasifica gastos en lote (uno por línea)")
+    p_ingest.add_argument("origen", nargs="?", default="-",
+                          help='Archivo de texto, o "-" para stdin')
+    p_ingest.add_argument("--hilos", type=int, default=8,
+                          help="Clasificaciones en paralelo")
+    p_ingest.add_argument("--lote", type=int, default=200,
+                          help="Gastos por escritura al ledger")
+    args = parser.parse_args()
+
+    verificar_api_key()
+    usuario = normalizar_usuario(args.usuario)
+    if args.comando == "ingest":
+        ingest(args.origen, hilos=args.hilos, lote=args.lote, usuario=usuario)
+    else:
+        menu(usuario)
@@ -0,0 +1,214 @@
+import csv
+import os
+import re
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = Path(__file__).resolve().parent
+TASAS_PATH = BASE_DIR / "tasas_cambio.csv"
+
+# Esquema del ledger, el mismo en todos los backends y en los reportes
+COLUMNAS = ["Fecha", "Monto", "Categoria", "Descripcion", "Moneda"]
+
+# Moneda en la que están los gastos viejos (sin columna Moneda) y los presupuestos
+MONEDA_BASE = "USD"
+
+SIMBOLOS = {
+    "USD": "$",
+    "EUR": "€",
+    "GBP": "£",
+    "MXN": "MX$",
+    "COP": "COL$",
+    "ARS": "AR$",
+    "CLP": "CLP$",
+    "PEN": "S/",
+}
+
+
+def _junto_al_monto(codigo: str) -> str:
+    # Códigos que también son palabras ("pen drive", "cop") o partes de
+    # palabras ("compras/"): solo cuentan pegados a un número
+    return rf"\d\s*{codigo}(?!\w)|(?<!\w){codigo}\s*\d"
+
+
+# Orden importa: "$" solo (sin prefijo) se toma como USD al final
+_PATRONES = [
+    (r"€|\beur\b|\beuros?\b", "EUR"),
+    (r"£|\bgbp\b|\blibras?\b", "GBP"),
+    (r"\bmxn\b|mx\$", "MXN"),
+    (_junto_al_monto("cop") + r"|col\$", "COP"),
+    (r"\bars\b|ar\$", "ARS"),
+    (r"\bclp\b|clp\$", "CLP"),
+    (_junto_al_monto("pen") + "|" + _junto_al_monto("s/") + r"|\bsoles?\b", "PEN"),
+    (r"\busd\b|us\$|\bd[oó]lar(es)?\b|\$", "USD"),
+]
+
+
+def detectar_moneda(texto: str, defecto: str = MONEDA_BASE) -> str:
+    """'12 € café' -> 'EUR'. Si el texto no menciona moneda, la base."""
+    if not isinstance(texto, str):
+        return defecto
+    texto = texto.lower()
+    for patron, moneda in _PATRONES:
+        if re.search(patron, texto):
+            return _con_tasa(moneda, defecto)
+    return defecto
+
+
+def normalizar_moneda(moneda, defecto: str = MONEDA_BASE) -> str:
+    """Código ISO de 3 letras con tasa en tasas_cambio.csv; si no, `defecto`."""
+    if not isinstance(moneda, str) or not moneda.strip():
+        return defecto
+    moneda = moneda.strip().upper()
+    if not re.fullmatch(r"[A-Z]{3}", moneda):
+        return defecto
+    return _con_tasa(moneda, defecto)
+
+
+def _con_tasa(moneda: str, defecto: str) -> str:
+    # Una moneda sin tasa se convertiría 1:1 (como si fuera MONEDA_BASE)
+    if moneda in monedas_disponibles():
+        return moneda
+    warnings.warn(f"{moneda} no tiene tasa en tasas_cambio.csv; se usa {defecto}", stacklevel=3)
+    return defecto
+
+
+def simbolo(moneda: str) -> str:
+    return SIMBOLOS.get(moneda, f"{moneda} ")
+
+
+def asegurar_columna_moneda(ruta) -> bool:
+    """
+    CSVs de antes de la columna Moneda: la agrega al final con MONEDA_BASE
+    (una sola vez, reescritura atómica). Devuelve True si migró.
+    """
+    ruta = Path(ruta)
+    if not ruta.exists():
+        return False
+    with open(ruta, mode="r", newline="", encoding="utf-8") as file:
+        encabezado = next(csv.reader(file), None)
+    if not encabezado or "Moneda" in encabezado:
+        return False
+
+    tmp = ruta.with_suffix(ruta.suffix + ".tmp")
+    with open(ruta, mode="r", newline="", encoding="utf-8") as origen, \
+            open(tmp, mode="w", newline="", encoding="utf-8") as destino:
+        reader = csv.reader(origen)
+        writer = csv.writer(destino)
+        writer.writerow([*next(reader), "Moneda"])
+        ancho = len(encabezado)
+        for fila in reader:
+            if fila:
+                writer.writerow([*fila[:ancho], *[""] * (ancho - len(fila)), MONEDA_BASE])
+    os.replace(tmp, ruta)
+    return True
+
+
+# ----------------------------
+# Tabla de tasas (tasas_cambio.csv)
+# ----------------------------
+_cache = {"version": None, "tasas": None}
+
+
+def version_tasas(ruta=TASAS_PATH) -> tuple | None:
+    ruta = Path(ruta)
+    if not ruta.exists():
+        return None
+    stat = ruta.stat()
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def cargar_tasas(ruta=TASAS_PATH) -> pd.DataFrame:
+    """
+    Fecha, Moneda, Tasa: cuántas unidades de MONEDA_BASE vale 1 unidad de
+    Moneda desde esa fecha. Ordenada por Fecha (lo que pide merge_asof).
+    """
+    version = version_tasas(ruta)
+    if _cache["version"] == version and _cache["tasas"] is not None:
+        return _cache["tasas"]
+
+    if version is None:
+        tasas = pd.DataFrame({"Fecha": pd.Series(dtype="datetime64[ns]"),
+                              "Moneda": pd.Series(dtype=str),
+                              "Tasa": pd.Series(dtype=float)})
+    else:
+        tasas = pd.read_csv(ruta)
+        tasas["Fecha"] = pd.to_datetime(tasas["Fecha"], errors="coerce").astype("datetime64[ns]")
+        tasas["Moneda"] = tasas["Moneda"].astype(str).str.strip().str.upper()
+        tasas["Tasa"] = pd.to_numeric(tasas["Tasa"], errors="coerce")
+        tasas = tasas.dropna().query("Tasa > 0").sort_values("Fecha", kind="stable")
+        tasas = tasas.reset_index(drop=True)[["Fecha", "Moneda", "Tasa"]]
+
+    _cache.update(version=version, tasas=tasas)
+    return tasas
+
+
+def monedas_disponibles(tasas: pd.DataFrame | None = None) -> list[str]:
+    tasas = cargar_tasas() if tasas is None else tasas
+    return [MONEDA_BASE, *sorted(set(tasas["Moneda"]) - {MONEDA_BASE})]
+
+
+# ----------------------------
+# Conversión vectorizada
+# ----------------------------
+def _tasas_a_base(fechas: pd.Series, monedas: pd.Series, tasas: pd.DataFrame) -> np.ndarray:
+    """
+    Tasa vigente (última con Fecha <= fecha) para cada fila, con un
+    merge_asof por moneda. Si no hay tasa anterior se usa la primera
+    posterior; si la moneda no está en la tabla, 1.0.
+    """
+    resultado = np.ones(len(fechas))
+    otras = (monedas != MONEDA_BASE).to_numpy()
+    if not otras.any() or tasas.empty:
+        return resultado
+
+    consulta = pd.DataFrame({
+        "Fecha": fechas[otras].astype("datetime64[ns]").to_numpy(),
+        "Moneda": monedas[otras].to_numpy(),
+        "_fila": np.flatnonzero(otras),
+    }).sort_values("Fecha", kind="stable")
+    # merge_asof exige el mismo dtype en la llave "by" de ambos lados
+    consulta["Moneda"] = consulta["Moneda"].astype(tasas["Moneda"].dtype)
+
+    atras = pd.merge_asof(consulta, tasas, on="Fecha", by="Moneda", direction="backward")
+    if atras["Tasa"].isna().any():
+        adelante = pd.merge_asof(consulta, tasas, on="Fecha", by="Moneda", direction="forward")
+        atras["Tasa"] = atras["Tasa"].fillna(adelante["Tasa"])
+
+    sin_tasa = atras.loc[atras["Tasa"].isna(), "Moneda"].unique()
+    if len(sin_tasa):
+        warnings.warn(f"Sin tasa en tasas_cambio.csv para {', '.join(map(str, sin_tasa))}: "
+                      "se toman 1:1 con " + MONEDA_BASE, stacklevel=3)
+    resultado[atras["_fila"].to_numpy()] = atras["Tasa"].fillna(1.0).to_numpy()
+    return resultado
+
+
+def convertir(df: pd.DataFrame, destino: str = MONEDA_BASE,
+              tasas: pd.DataFrame | None = None) -> pd.Series:
+    """Columna Monto de df expresada en `destino`, según la fecha de cada gasto."""
+    if df.empty:
+        return pd.Series(dtype=float, index=df.index)
+    tasas = cargar_tasas() if tasas is None else tasas
+
+    montos = pd.to_numeric(df["Monto"], errors="coerce").fillna(0.0)
+    if "Moneda" in df.columns:
+        monedas = df["Moneda"].fillna(MONEDA_BASE).astype(str)
+    else:
+        monedas = pd.Series(MONEDA_BASE, index=df.index)
+    if destino == MONEDA_BASE and (monedas == MONEDA_BASE).all():
+        return montos
+
+    fechas = pd.to_datetime(df["Fecha"], errors="coerce")
+    en_base = montos.to_numpy() * _tasas_a_base(fechas, monedas, tasas)
+    if destino != MONEDA_BASE:
+        en_base = en_base / _tasas_a_base(fechas, pd.Series(destino, index=df.index), tasas)
+    return pd.Series(en_base, index=df.index)
+
+
+def convertir_monto(monto: float, moneda: str, destino: str, fecha) -> float:
+    """Un solo monto (para los contadores de presupuesto)."""
+    fila = pd.DataFrame({"Fecha": [fecha], "Monto": [monto], "Moneda": [moneda]})
+    return float(convertir(fila, destino).iloc[0])
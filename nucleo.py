@@ -0,0 +1,669 @@
+import csv
+import datetime
+import io
+import json
+import os
+import re
+import threading
+import time
+from datetime import date, timedelta
+from functools import lru_cache
+from pathlib import Path
+
+import pandas as pd
+
+import cache_usuarios
+import columnar
+import particiones
+import pronostico
+import respaldo
+from monedas import (
+    COLUMNAS,
+    MONEDA_BASE,
+    asegurar_columna_moneda,
+    convertir,
+    detectar_moneda,
+    normalizar_moneda,
+    version_tasas,
+)
+from prompt_ia import (
+    MAX_TOKENS,
+    MAX_TOKENS_REINTENTO,
+    mensajes_clasificacion,
+    registrar_uso,
+)
+
+# ----------------------------
+# Config / rutas
+# ----------------------------
+# Rutas absolutas (junto al código), no relativas al directorio de trabajo:
+# app, main, finanzas y api leen y escriben siempre los mismos archivos
+BASE_DIR = Path(__file__).resolve().parent
+
+# "csv" (un solo gastos.csv), "particionado" (ledger/AAAA/MM.csv + manifest.json)
+# o "parquet" (ledger_parquet/gastos.parquet + delta.csv, requiere pyarrow)
+LEDGER_BACKEND = os.getenv("LEDGER_BACKEND", "csv")
+if LEDGER_BACKEND == "parquet" and not columnar.DISPONIBLE:
+    LEDGER_BACKEND = "csv"
+
+# Un directorio por usuario: usuarios/<usuario>/gastos.csv, categorias.json, ...
+# Sin usuario (None) se usan los archivos de siempre en BASE_DIR
+USUARIOS_DIR = BASE_DIR / "usuarios"
+
+
+def normalizar_usuario(usuario) -> str | None:
+    """'Ana.Perez@x.com ' -> 'ana.perez_x.com'; vacío -> None (ledger compartido)."""
+    if not isinstance(usuario, str):
+        return None
+    usuario = re.sub(r"[^a-z0-9_.-]", "_", usuario.strip().lower())[:64].strip("._")
+    return usuario or None
+
+
+def rutas(usuario: str | None = None) -> dict[str, Path]:
+    """Todos los archivos de un usuario (el ledger en sus tres backends y sus extras)."""
+    base = USUARIOS_DIR / usuario if usuario else BASE_DIR
+    return {
+        "base": base,
+        "csv": base / "gastos.csv",
+        "ledger": base / "ledger",
+        "parquet": base / "ledger_parquet",
+        "categorias": base / "categorias.json",
+        "presupuestos": base / "presupuestos.json",
+        "contadores": base / "presupuestos_contadores.json",
+        "respaldo": base / "carpeta_respaldo",
+        "reportes": base / "reportes",
+    }
+
+
+# ----------------------------
+# Escritura / lectura
+# ----------------------------
+def crear_archivo(usuario: str | None = None):
+    r = rutas(usuario)
+    r["base"].mkdir(parents=True, exist_ok=True)
+    # gastos.csv de antes de la columna Moneda -> todo en MONEDA_BASE
+    asegurar_columna_moneda(r["csv"])
+    if LEDGER_BACKEND == "particionado":
+        # Primera vez: migra gastos.csv al layout particionado
+        if not particiones.existe(r["ledger"]):
+            if r["csv"].exists():
+                particiones.migrar_desde_csv(r["csv"], r["ledger"])
+            else:
+                particiones.escribir_filas(r["ledger"], [])
+        return
+    if LEDGER_BACKEND == "parquet":
+        # Primera vez: importa gastos.csv (sigue sirviendo como import/export)
+        if not columnar.existe(r["parquet"]):
+            columnar.importar_csv(r["csv"], r["parquet"])
+        return
+    if not r["csv"].exists():
+        with open(r["csv"], mode="w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(COLUMNAS)
+
+
+def guardar_gastos(lista: list[dict], usuario: str | None = None, fecha: str | None = None) -> str:
+    """
+    Agrega varios gastos al ledger con una sola escritura por archivo y
+    devuelve la fecha con la que se guardaron (hoy si no se indica).
+    """
+    r = rutas(usuario)
+    fecha = fecha or datetime.datetime.now().strftime("%Y-%m-%d")
+    filas = [
+        {"Fecha": fecha, "Monto": datos["Monto"], "Categoria": datos["Categoria"],
+         "Descripcion": datos["Descripcion"], "Moneda": datos.get("Moneda") or MONEDA_BASE}
+        for datos in lista
+    ]
+    if not filas:
+        return fecha
+    if LEDGER_BACKEND == "particionado":
+        particiones.agregar_filas(r["ledger"], filas)
+        return fecha
+    if LEDGER_BACKEND == "parquet":
+        columnar.agregar_filas(r["parquet"], filas)
+        return fecha
+    with open(r["csv"], mode="a", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerows([fila[col] for col in COLUMNAS] for fila in filas)
+    return fecha
+
+
+def guardar_gasto(datos: dict, usuario: str | None = None) -> str:
+    """Agrega el gasto al ledger y devuelve la fecha con la que se guardó."""
+    return guardar_gastos([datos], usuario)
+
+
+class EscritorLotes:
+    """
+    Acumula gastos y los guarda de a `tamano` por vez (con guardar_gastos,
+    así sirve para cualquier backend), con un lock para que varios hilos
+    puedan agregar sin pisarse.
+    """
+
+    def __init__(self, usuario: str | None = None, tamano: int = 200, fecha: str | None = None):
+        self.usuario = usuario
+        self.tamano = tamano
+        self.fecha = fecha
+        self.buffer = []
+        self.escritas = 0
+        self.lock = threading.Lock()
+
+    def agregar(self, datos: dict):
+        with self.lock:
+            self.buffer.append(datos)
+            if len(self.buffer) >= self.tamano:
+                self._vaciar()
+
+    def cerrar(self):
+        with self.lock:
+            self._vaciar()
+
+    def _vaciar(self):
+        if not self.buffer:
+            return
+        guardar_gastos(self.buffer, self.usuario, self.fecha)
+        self.escritas += len(self.buffer)
+        self.buffer = []
+
+
+def _limpiar_df(df: pd.DataFrame) -> pd.DataFrame:
+    # Limpieza segura
+    if "Fecha" in df.columns:
+        df["Fecha"] = pd.to_datetime(df["Fecha"], errors="coerce").dt.date
+    if "Monto" in df.columns:
+        df["Monto"] = pd.to_numeric(df["Monto"], errors="coerce").fillna(0.0)
+    if "Moneda" in df.columns:
+        df["Moneda"] = df["Moneda"].fillna(MONEDA_BASE)
+    else:
+        df["Moneda"] = MONEDA_BASE
+
+    return df.dropna(subset=["Fecha"])
+
+
+def leer_df(fecha_ini: date | None = None, fecha_fin: date | None = None,
+            usuario: str | None = None) -> pd.DataFrame:
+    r = rutas(usuario)
+    if LEDGER_BACKEND == "parquet":
+        # Ya viene tipado y con el filtro de fechas empujado al lector
+        return columnar.leer(r["parquet"], fecha_ini=fecha_ini, fecha_fin=fecha_fin)
+    if LEDGER_BACKEND == "particionado":
+        # Solo abre las particiones que se cruzan con el rango
+        df = particiones.leer_rango(r["ledger"], fecha_ini, fecha_fin)
+    elif not r["csv"].exists():
+        return pd.DataFrame(columns=COLUMNAS)
+    else:
+        df = pd.read_csv(r["csv"])
+
+    df = _limpiar_df(df)
+
+    if fecha_ini is not None:
+        df = df[df["Fecha"] >= fecha_ini]
+    if fecha_fin is not None:
+        df = df[df["Fecha"] <= fecha_fin]
+    return df
+
+
+def _archivos_csv(usuario: str | None = None) -> list[Path] | None:
+    """CSVs que forman el ledger, en el orden de leer_df (None con parquet)."""
+    r = rutas(usuario)
+    if LEDGER_BACKEND == "particionado":
+        manifest = particiones.cargar_manifest(r["ledger"])
+        return [r["ledger"] / entrada["archivo"]
+                for _mes, entrada in sorted(manifest["particiones"].items())]
+    if LEDGER_BACKEND == "csv":
+        return [r["csv"]] if r["csv"].exists() else []
+    return None
+
+
+def _fin_de_linea(ruta: Path) -> int:
+    # Hasta el último salto de línea: una fila a medio escribir se lee la próxima vez
+    tamano = ruta.stat().st_size
+    with open(ruta, mode="rb") as file:
+        file.seek(max(tamano - 65536, 0))
+        cola = file.read()
+    corte = cola.rfind(b"\n")
+    return tamano if corte < 0 else tamano - len(cola) + corte + 1
+
+
+def _marca(ruta: Path, tamano: int) -> str:
+    # Últimos bytes hasta `tamano`: si cambian, el archivo se reescribió
+    with open(ruta, mode="rb") as file:
+        file.seek(max(tamano - 256, 0))
+        return file.read(tamano - max(tamano - 256, 0)).hex()
+
+
+def _leer_tramos(tramos: list[tuple]) -> pd.DataFrame:
+    """Filas de [(ruta, ini, fin), ...]; ini=0 incluye el encabezado."""
+    partes = []
+    for ruta, ini, fin in tramos:
+        with open(ruta, mode="rb") as file:
+            encabezado = next(csv.reader([file.readline().decode("utf-8")]))
+            file.seek(ini)
+            datos = file.read(fin - ini)
+        if not datos.strip():
+            continue
+        if ini == 0:
+            partes.append(pd.read_csv(io.BytesIO(datos)))
+        else:
+            partes.append(pd.read_csv(io.BytesIO(datos), header=None, names=encabezado))
+    if not partes:
+        return pd.DataFrame(columns=COLUMNAS)
+    return _limpiar_df(pd.concat(partes, ignore_index=True))
+
+
+def _leer_incremental(archivos: list[Path], anterior) -> tuple[pd.DataFrame, list]:
+    """
+    (ledger, cursor). Si el ledger anterior sigue siendo un prefijo del
+    actual (solo se agregaron filas al último archivo o archivos nuevos al
+    final), se leen únicamente los bytes nuevos; si no, todo.
+    """
+    cursor = [(str(ruta), _fin_de_linea(ruta)) for ruta in archivos]
+    cursor = [(ruta, tamano, _marca(Path(ruta), tamano)) for ruta, tamano in cursor]
+
+    df_anterior, cursor_anterior = anterior if anterior is not None else (None, None)
+    prefijo = (
+        cursor_anterior is not None
+        and len(cursor_anterior) <= len(cursor)
+        and all(ruta == actual[0] and tamano <= actual[1] and marca == _marca(Path(ruta), tamano)
+                for (ruta, tamano, marca), actual in zip(cursor_anterior, cursor))
+        # Solo el último archivo conocido puede crecer (sino las filas nuevas
+        # quedarían en el medio)
+        and all(a[1] == b[1] for a, b in zip(cursor_anterior[:-1], cursor))
+    )
+    if not prefijo:
+        return _leer_tramos([(ruta, 0, tamano) for ruta, tamano, _ in cursor]), cursor
+
+    tramos = []
+    if cursor_anterior:
+        ruta, desde, _ = cursor_anterior[-1]
+        tramos.append((ruta, desde, cursor[len(cursor_anterior) - 1][1]))
+    tramos += [(ruta, 0, tamano) for ruta, tamano, _ in cursor[len(cursor_anterior):]]
+    nuevas = _leer_tramos(tramos)
+    if nuevas.empty:
+        return df_anterior, cursor
+    return pd.concat([df_anterior, nuevas], ignore_index=True), cursor
+
+
+def leer_df_cacheado(usuario: str | None = None) -> pd.DataFrame:
+    """
+    Ledger completo desde el caché compartido del proceso. Cuando cambia la
+    versión y solo se agregaron filas, se parsean solo las nuevas (backends
+    csv y particionado). Compartido entre hilos/sesiones: no modificarlo.
+    """
+    def calcular(anterior):
+        archivos = _archivos_csv(usuario)
+        if archivos is None:
+            return leer_df(usuario=usuario), None
+        return _leer_incremental(archivos, anterior)
+
+    df, _cursor = cache_usuarios.obtener(
+        usuario, ("ledger",), version_ledger(usuario), calcular, incremental=True)
+    return df
+
+
+def pronostico_cacheado(usuario: str | None = None) -> dict:
+    """
+    {"modelo", "anomalias", "tasas"} desde el caché compartido. Cuando el
+    ledger cambia se reajusta solo con las filas nuevas; en un proceso recién
+    iniciado (cada corrida del CLI) el primer llamado ajusta desde cero.
+    """
+    def actualizar(anterior):
+        # Si cambiaron las tasas, lo ya agregado en MONEDA_BASE quedó viejo
+        df = leer_df_cacheado(usuario)
+        if anterior is not None and anterior["tasas"] != version_tasas():
+            anterior = None
+        modelo = pronostico.ajustar(df, anterior["modelo"] if anterior else None)
+        return {"modelo": modelo, "anomalias": pronostico.detectar_anomalias(modelo, df),
+                "tasas": version_tasas()}
+
+    return cache_usuarios.obtener(
+        usuario, ("pronostico",), (version_ledger(usuario), version_tasas()),
+        actualizar, incremental=True)
+
+
+def leer_ultimos(n: int, usuario: str | None = None) -> pd.DataFrame:
+    if LEDGER_BACKEND == "particionado":
+        return _limpiar_df(particiones.leer_ultimas(rutas(usuario)["ledger"], n))
+    return leer_df(usuario=usuario).tail(n)
+
+
+def ledger_vacio(usuario: str | None = None) -> bool:
+    if LEDGER_BACKEND == "particionado":
+        return particiones.rango_fechas(rutas(usuario)["ledger"]) is None
+    if LEDGER_BACKEND == "parquet":
+        return columnar.num_filas(rutas(usuario)["parquet"]) == 0
+    return leer_df(usuario=usuario).empty
+
+
+def rango_fechas_ledger(usuario: str | None = None) -> tuple[date, date]:
+    if LEDGER_BACKEND in ("particionado", "parquet"):
+        if LEDGER_BACKEND == "particionado":
+            rango = particiones.rango_fechas(rutas(usuario)["ledger"])
+        else:
+            rango = columnar.rango_fechas(rutas(usuario)["parquet"])
+        if rango is not None:
+            return rango
+        return date.today(), date.today()
+    df = leer_df(usuario=usuario)
+    return df["Fecha"].min(), df["Fecha"].max()
+
+
+def _sumar_por_categoria(df: pd.DataFrame, moneda: str) -> pd.DataFrame:
+    # Conversión vectorizada (merge_asof por fecha) y después un solo groupby
+    montos = convertir(df, moneda)
+    return montos.groupby(df["Categoria"]).sum().rename("Monto").reset_index()
+
+
+def resumen_por_categoria(moneda: str = MONEDA_BASE, usuario: str | None = None) -> pd.DataFrame:
+    r = rutas(usuario)
+    if LEDGER_BACKEND == "particionado":
+        # Sale del manifest, sin abrir particiones, si todo está en `moneda`
+        totales = particiones.totales_por_categoria(r["ledger"])
+        if set(totales) <= {moneda}:
+            totales = totales.get(moneda, {})
+            resumen = pd.DataFrame(
+                {"Categoria": list(totales), "Monto": list(totales.values())})
+        else:
+            resumen = _sumar_por_categoria(_limpiar_df(particiones.leer_rango(r["ledger"])), moneda)
+    elif LEDGER_BACKEND == "parquet":
+        # Proyección: solo se leen las columnas del pie (+ las de la conversión)
+        resumen = _sumar_por_categoria(
+            columnar.leer(r["parquet"], columnas=["Fecha", "Categoria", "Monto", "Moneda"]), moneda)
+    else:
+        resumen = _sumar_por_categoria(leer_df(usuario=usuario), moneda)
+    return resumen.sort_values("Monto", ascending=False)
+
+
+def origen_reportes(usuario: str | None = None) -> Path:
+    """
+    Lo que lee reportes.generar_reportes: gastos.csv, el directorio
+    particionado tal cual (una partición por worker) o, con parquet,
+    un CSV exportado con el formato de siempre.
+    """
+    r = rutas(usuario)
+    if LEDGER_BACKEND == "csv":
+        return r["csv"]
+    if LEDGER_BACKEND == "particionado":
+        return r["ledger"]
+    destino = r["base"] / "gastos_export.csv"
+    leer_df(usuario=usuario)[COLUMNAS].to_csv(destino, index=False)
+    return destino
+
+
+def archivos_ledger(usuario: str | None = None) -> list[Path]:
+    """Archivos que forman el ledger activo (lo que se respalda)."""
+    r = rutas(usuario)
+    if LEDGER_BACKEND == "particionado":
+        return [r["ledger"] / particiones.MANIFEST, *sorted(r["ledger"].glob("*/*.csv"))]
+    if LEDGER_BACKEND == "parquet":
+        return [r["parquet"] / columnar.PARQUET, r["parquet"] / columnar.DELTA]
+    return [r["csv"]]
+
+
+def guardar_df(df: pd.DataFrame, motivo: str = "reescritura", usuario: str | None = None) -> None:
+    """Reescribe el ledger completo (eliminar último / duplicados)."""
+    r = rutas(usuario)
+    # Snapshot antes de cualquier reescritura destructiva
+    respaldo.respaldar(archivos_ledger(usuario), motivo=motivo,
+                       base_dir=r["base"], respaldo_dir=r["respaldo"])
+    if LEDGER_BACKEND == "particionado":
+        particiones.reescribir_df(r["ledger"], df)
+    elif LEDGER_BACKEND == "parquet":
+        columnar.reescribir_df(r["parquet"], df)
+    else:
+        df.to_csv(r["csv"], index=False)
+
+
+def restaurar_ledger(snapshot_id: str, usuario: str | None = None) -> list[str]:
+    """
+    Vuelve el ledger al estado del snapshot: restaura sus archivos (manifest
+    incluido) y borra los que se crearon después (delta.csv, meses nuevos).
+    """
+    r = rutas(usuario)
+    return respaldo.restaurar(snapshot_id, base_dir=r["base"], respaldo_dir=r["respaldo"],
+                              actuales=archivos_ledger(usuario))
+
+
+def totales_por_periodo(df_in: pd.DataFrame, moneda: str | None = None):
+    # Devuelve: total_hoy, total_sem, total_mes, df_hoy, df_sem, df_mes
+    # Con `moneda`, Monto sale convertido (una pasada vectorizada)
+
+    # Caso None/vacío
+    if df_in is None or df_in.empty:
+        vacio = pd.DataFrame(columns=COLUMNAS)
+        return 0.0, 0.0, 0.0, vacio, vacio, vacio
+
+    df = df_in.copy()
+
+    # Asegurar columnas mínimas (por si vienen diferentes)
+    for col in COLUMNAS:
+        if col not in df.columns:
+            df[col] = MONEDA_BASE if col == "Moneda" else None
+
+    # Limpiar tipos
+    df["Fecha"] = pd.to_datetime(df["Fecha"], errors="coerce").dt.date
+    df["Monto"] = pd.to_numeric(df["Monto"], errors="coerce").fillna(0.0)
+    if moneda is not None:
+        df["Monto"] = convertir(df, moneda)
+        df["Moneda"] = moneda
+
+    # Quitar fechas inválidas
+    df = df.dropna(subset=["Fecha"])
+
+    # Si quedó vacío después de limpiar
+    if df.empty:
+        vacio = pd.DataFrame(columns=df.columns)
+        return 0.0, 0.0, 0.0, vacio, vacio, vacio
+
+    hoy = date.today()
+    inicio_semana = hoy - timedelta(days=hoy.weekday())  # lunes
+    inicio_mes = hoy.replace(day=1)
+
+    df_hoy = df[df["Fecha"] == hoy].copy()
+    df_sem = df[(df["Fecha"] >= inicio_semana) & (df["Fecha"] <= hoy)].copy()
+    df_mes = df[(df["Fecha"] >= inicio_mes) & (df["Fecha"] <= hoy)].copy()
+
+    total_hoy = float(df_hoy["Monto"].sum()) if not df_hoy.empty else 0.0
+    total_sem = float(df_sem["Monto"].sum()) if not df_sem.empty else 0.0
+    total_mes = float(df_mes["Monto"].sum()) if not df_mes.empty else 0.0
+
+    return total_hoy, total_sem, total_mes, df_hoy, df_sem, df_mes
+
+
+# ----------------------------
+# Versión (para caches)
+# ----------------------------
+def version_ledger(usuario: str | None = None) -> tuple:
+    """
+    (backend, usuario, mtime, tamaño) de los archivos del ledger: cambia con
+    cada escritura y no se confunde entre usuarios.
+    """
+    r = rutas(usuario)
+    if LEDGER_BACKEND == "particionado":
+        archivos = [r["ledger"] / particiones.MANIFEST]
+    elif LEDGER_BACKEND == "parquet":
+        archivos = [r["parquet"] / columnar.PARQUET, r["parquet"] / columnar.DELTA]
+    else:
+        archivos = [r["csv"]]
+
+    version = [LEDGER_BACKEND, usuario]
+    for ruta in archivos:
+        if ruta.exists():
+            stat = ruta.stat()
+            version.append((stat.st_mtime_ns, stat.st_size))
+        else:
+            version.append(None)
+    return tuple(version)
+
+
+# ----------------------------
+# Categorías (base + extras de cada usuario en categorias.json)
+# ----------------------------
+CATEGORIAS_BASE = [
+    "Comida", "Transporte", "Hogar", "Entretenimiento", "Salud", "Otros"
+]
+
+
+def cargar_categorias(usuario: str | None = None) -> list[str]:
+    cats = set(CATEGORIAS_BASE)
+
+    # categorías guardadas en categorias.json (una por usuario)
+    cats_path = rutas(usuario)["categorias"]
+    if cats_path.exists():
+        try:
+            data = json.loads(cats_path.read_text(encoding="utf-8"))
+            if isinstance(data, list):
+                cats.update([str(x).strip() for x in data if str(x).strip()])
+        except Exception:
+            pass
+
+    return sorted(cats)
+
+
+def guardar_categorias(cats: list[str], usuario: str | None = None) -> None:
+    # guarda solo las extras (no repite base)
+    extras = sorted(set(cats) - set(CATEGORIAS_BASE))
+    rutas(usuario)["categorias"].write_text(json.dumps(
+        extras, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+# ----------------------------
+# Clasificación con IA
+# ----------------------------
+MODELO = "gpt-4.1-mini"
+
+
+def api_key() -> str | None:
+    """OPENAI_API_KEY del entorno o del .env junto al proyecto."""
+    if not os.getenv("OPENAI_API_KEY"):
+        try:
+            from dotenv import load_dotenv
+        except ImportError:  # sin python-dotenv solo se usa el entorno
+            return None
+        load_dotenv(BASE_DIR / ".env", override=True)
+    return os.getenv("OPENAI_API_KEY")
+
+
+@lru_cache(maxsize=4)
+def crear_cliente(key: str | None):
+    # Se crea una sola vez por proceso (por key), no en cada llamada
+    if not key:
+        return None
+    from openai import OpenAI
+    return OpenAI(api_key=key)
+
+
+def _extraer_json(texto: str) -> str:
+    """
+    Si el modelo devuelve texto extra (ej: 'Aquí está el JSON: {...}'),
+    intenta extraer el primer objeto JSON {...}.
+    """
+    texto = texto.strip()
+    if texto.startswith("{") and texto.endswith("}"):
+        return texto
+    match = re.search(r"\{.*\}", texto, flags=re.DOTALL)
+    if match:
+        return match.group(0).strip()
+    # Si no encontró nada, devuelve tal cual para que el parser falle
+    return texto
+
+
+def _normalizar_categoria(cat: str, validas) -> str:
+    if not isinstance(cat, str):
+        return "Otros"
+    cat = cat.strip()
+    mapping = {
+        "Alimentacion": "Comida",
+        "Alimentación": "Comida",
+    }
+    if cat in validas:
+        return cat
+    # Misma categoría con otras mayúsculas ("comida" -> "Comida")
+    por_minuscula = {c.lower(): c for c in validas}
+    if cat.lower() in por_minuscula:
+        return por_minuscula[cat.lower()]
+    return mapping.get(cat, "Otros")
+
+
+def normalizar_monto(monto) -> float:
+    """Acepta números o strings como "45", "45.5", "$45", "45,20"."""
+    if isinstance(monto, (int, float)):
+        return float(monto)
+    if isinstance(monto, str):
+        # La moneda ("$", "USD", "€"...) se detecta aparte, aquí solo el número
+        s = monto.strip().replace(",", ".")
+        s = re.sub(r"[^0-9.]", "", s)
+        try:
+            return float(s) if s else 0.0
+        except ValueError:
+            return 0.0
+    return 0.0
+
+
+def clasificar_con_ia(texto_usuario: str, modelo: str = MODELO,
+                      usuario: str | None = None) -> dict:
+    """
+    Devuelve un dict con: Monto (float), Categoria (str), Descripcion (str),
+    Moneda (código ISO). Las categorías permitidas son las del usuario.
+    """
+    respaldo_seguro = {"Monto": 0.0, "Categoria": "Otros", "Descripcion": texto_usuario,
+                       "Moneda": detectar_moneda(texto_usuario)}
+    client = crear_cliente(api_key())
+    if not client:
+        return respaldo_seguro
+
+    validas = cargar_categorias(usuario)
+    # Instrucciones + categorías van en un system fijo (prefijo cacheable)
+    mensajes = mensajes_clasificacion(texto_usuario, validas)
+
+    def pedir(max_tokens: int):
+        # 1) Intento “fuerte”: forzar salida JSON con response_format
+        inicio = time.perf_counter()
+        try:
+            resp = client.chat.completions.create(
+                model=modelo,
+                messages=mensajes,
+                temperature=0,
+                max_tokens=max_tokens,
+                response_format={"type": "json_object"},
+            )
+        except Exception:
+            # 2) Plan B: sin response_format (por si la cuenta/modelo lo rechaza)
+            inicio = time.perf_counter()
+            resp = client.chat.completions.create(
+                model=modelo,
+                messages=mensajes,
+                temperature=0,
+                max_tokens=max_tokens,
+            )
+        registrar_uso(resp, time.perf_counter() - inicio, modelo)
+        return resp
+
+    resp = pedir(MAX_TOKENS)
+    # JSON cortado por el tope (descripciones largas): se reintenta con más margen
+    if resp.choices[0].finish_reason == "length":
+        resp = pedir(MAX_TOKENS_REINTENTO)
+
+    try:
+        data = json.loads(_extraer_json(resp.choices[0].message.content))
+    except Exception:
+        return respaldo_seguro
+
+    descripcion = data.get("Descripcion", texto_usuario)
+    if not isinstance(descripcion, str) or not descripcion.strip():
+        descripcion = texto_usuario
+
+    return {
+        "Monto": normalizar_monto(data.get("Monto", 0)),
+        "Categoria": _normalizar_categoria(data.get("Categoria", "Otros"), validas),
+        "Descripcion": descripcion.strip(),
+        # Si el modelo no la da, se deduce del texto ("12 €", "200 mxn")
+        "Moneda": normalizar_moneda(data.get("Moneda"), defecto=detectar_moneda(texto_usuario)),
+    }
+
+
+@lru_cache(maxsize=4096)
+def clasificar_cacheado(texto: str, modelo: str = MODELO, usuario: str | None = None) -> tuple:
+    # Líneas repetidas (ej: "8 café" todos los días) no vuelven a llamar a la API
+    datos = clasificar_con_ia(texto, modelo, usuario)
+    return datos["Monto"], datos["Categoria"], datos["Descripcion"], datos["Moneda"]
@@ -0,0 +1,291 @@
+import csv
+import json
+import os
+import re
+import shutil
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+
+from monedas import COLUMNAS, MONEDA_BASE, asegurar_columna_moneda
+
+MANIFEST = "manifest.json"
+
+
+# ----------------------------
+# Manifest
+# ----------------------------
+def _ruta_particion(ledger_dir: Path, mes: str) -> Path:
+    """'2026-02' -> ledger/2026/02.csv"""
+    anio, num = mes.split("-")
+    return ledger_dir / anio / f"{num}.csv"
+
+
+def _mes_de(fecha: str) -> str | None:
+    fecha = (fecha or "").strip()
+    if not re.fullmatch(r"\d{4}-\d{2}-\d{2}", fecha):
+        return None
+    return fecha[:7]
+
+
+def _monto(valor) -> float:
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def existe(ledger_dir) -> bool:
+    _recuperar(Path(ledger_dir))
+    return (Path(ledger_dir) / MANIFEST).exists()
+
+
+def cargar_manifest(ledger_dir) -> dict:
+    """
+    Estructura:
+    {"particiones": {"2026-02": {"archivo": "2026/02.csv", "min": "2026-02-17",
+                                 "max": "2026-02-20", "filas": 25,
+                                 "totales": {"USD": {"Comida": 370.0, ...}}}}}
+    Los totales van por moneda (sin convertir). Manifests viejos con
+    {"Comida": 370.0} se leen como MONEDA_BASE.
+    """
+    ruta = Path(ledger_dir) / MANIFEST
+    if not ruta.exists():
+        return {"particiones": {}}
+    try:
+        data = json.loads(ruta.read_text(encoding="utf-8"))
+        if isinstance(data, dict) and isinstance(data.get("particiones"), dict):
+            return data
+    except Exception:
+        pass
+    return {"particiones": {}}
+
+
+def guardar_manifest(ledger_dir, manifest: dict) -> None:
+    # Escritura atómica: primero a un temporal y luego replace
+    ruta = Path(ledger_dir) / MANIFEST
+    tmp = ruta.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, ruta)
+
+
+def _actualizar_entrada(entrada: dict, fila: dict) -> None:
+    fecha = fila["Fecha"].strip()
+    entrada["min"] = min(entrada["min"], fecha) if entrada.get("min") else fecha
+    entrada["max"] = max(entrada["max"], fecha) if entrada.get("max") else fecha
+    entrada["filas"] = entrada.get("filas", 0) + 1
+    cat = fila.get("Categoria")
+    cat = cat.strip() if isinstance(cat, str) and cat.strip() else "Otros"
+    moneda = fila.get("Moneda")
+    moneda = moneda.strip() if isinstance(moneda, str) and moneda.strip() else MONEDA_BASE
+    entrada["totales"] = _totales_por_moneda(entrada.get("totales", {}))
+    totales = entrada["totales"].setdefault(moneda, {})
+    totales[cat] = round(totales.get(cat, 0.0) + _monto(fila.get("Monto")), 2)
+
+
+def _totales_por_moneda(totales: dict) -> dict:
+    # Formato viejo (sin moneda): {"Comida": 370.0}
+    if totales and not all(isinstance(v, dict) for v in totales.values()):
+        return {MONEDA_BASE: totales}
+    return totales
+
+
+# ----------------------------
+# Escritura
+# ----------------------------
+def _reemplazar(ledger_dir: Path, nuevo: Path) -> None:
+    """Cambia ledger_dir por `nuevo` (dos replace; _recuperar cubre un corte entre ambos)."""
+    viejo = ledger_dir.with_name(ledger_dir.name + ".viejo")
+    if viejo.exists():
+        shutil.rmtree(viejo)
+    if ledger_dir.exists():
+        os.replace(ledger_dir, viejo)
+    os.replace(nuevo, ledger_dir)
+    shutil.rmtree(viejo, ignore_errors=True)
+
+
+def _recuperar(ledger_dir: Path) -> None:
+    # Corte entre los dos replace: si el nuevo quedó completo (tiene
+    # manifest) se termina el cambio; si no, vuelve el anterior
+    if ledger_dir.exists():
+        return
+    nuevo = ledger_dir.with_name(ledger_dir.name + ".tmp")
+    viejo = ledger_dir.with_name(ledger_dir.name + ".viejo")
+    if (nuevo / MANIFEST).exists():
+        os.replace(nuevo, ledger_dir)
+        shutil.rmtree(viejo, ignore_errors=True)
+    elif viejo.exists():
+        os.replace(viejo, ledger_dir)
+
+
+def escribir_filas(ledger_dir, filas) -> dict:
+    """
+    Reescribe el ledger particionado completo a partir de un iterable de
+    filas (dicts). Devuelve el manifest nuevo.
+    Todo se escribe en ledger.tmp/ y se cambia al final: un corte a mitad
+    de camino deja el ledger anterior entero.
+    """
+    ledger_dir = Path(ledger_dir)
+    _recuperar(ledger_dir)
+    destino = ledger_dir.with_name(ledger_dir.name + ".tmp")
+    if destino.exists():
+        shutil.rmtree(destino)
+    destino.mkdir(parents=True)
+
+    manifest = {"particiones": {}}
+    archivos = {}
+    writers = {}
+    try:
+        for fila in filas:
+            mes = _mes_de(str(fila.get("Fecha", "")))
+            if mes is None:
+                continue
+            if mes not in writers:
+                ruta = _ruta_particion(destino, mes)
+                ruta.parent.mkdir(parents=True, exist_ok=True)
+                archivos[mes] = open(ruta, mode="w", newline="", encoding="utf-8")
+                writers[mes] = csv.DictWriter(
+                    archivos[mes], fieldnames=COLUMNAS, extrasaction="ignore")
+                writers[mes].writeheader()
+                manifest["particiones"][mes] = {
+                    "archivo": ruta.relative_to(destino).as_posix()}
+            writers[mes].writerow(fila)
+            _actualizar_entrada(manifest["particiones"][mes], fila)
+    finally:
+        for file in archivos.values():
+            file.close()
+
+    guardar_manifest(destino, manifest)
+    _reemplazar(ledger_dir, destino)
+    return manifest
+
+
+def migrar_desde_csv(csv_path, ledger_dir) -> dict:
+    """Convierte gastos.csv al layout ledger/AAAA/MM.csv + manifest.json."""
+    with open(csv_path, mode="r", newline="", encoding="utf-8") as file:
+        return escribir_filas(ledger_dir, csv.DictReader(file))
+
+
+def reescribir_df(ledger_dir, df: pd.DataFrame) -> dict:
+    """Reescribe todas las particiones desde un DataFrame (borrar/deduplicar)."""
+    df = df.copy()
+    df["Fecha"] = df["Fecha"].astype(str)
+    # Celdas vacías (NaN) van vacías, no como "nan", igual que en gastos.csv
+    df = df.astype(object).where(df.notna(), "")
+    return escribir_filas(ledger_dir, df.to_dict("records"))
+
+
+def agregar_filas(ledger_dir, filas: list[dict]) -> None:
+    """
+    Agrega filas a las particiones de sus meses: un append por partición
+    y una sola escritura del manifest para todo el lote.
+    """
+    ledger_dir = Path(ledger_dir)
+    por_mes = {}
+    for fila in filas:
+        mes = _mes_de(fila["Fecha"])
+        if mes is None:
+            raise ValueError(f"Fecha inválida: {fila['Fecha']!r}")
+        por_mes.setdefault(mes, []).append(fila)
+    if not por_mes:
+        return
+
+    manifest = cargar_manifest(ledger_dir)
+    for mes, filas_mes in por_mes.items():
+        ruta = _ruta_particion(ledger_dir, mes)
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        nueva = not ruta.exists()
+        # Partición de antes de la columna Moneda: se migra antes del append
+        asegurar_columna_moneda(ruta)
+        with open(ruta, mode="a", newline="", encoding="utf-8") as file:
+            writer = csv.DictWriter(file, fieldnames=COLUMNAS, extrasaction="ignore")
+            if nueva:
+                writer.writeheader()
+            writer.writerows(filas_mes)
+
+        entrada = manifest["particiones"].setdefault(
+            mes, {"archivo": ruta.relative_to(ledger_dir).as_posix()})
+        for fila in filas_mes:
+            _actualizar_entrada(entrada, fila)
+    guardar_manifest(ledger_dir, manifest)
+
+
+def agregar_fila(ledger_dir, fila: dict) -> None:
+    """Agrega una fila a la partición de su mes y actualiza el manifest."""
+    agregar_filas(ledger_dir, [fila])
+
+
+# ----------------------------
+# Lectura con poda de particiones
+# ----------------------------
+def particiones_en_rango(manifest: dict, fecha_ini: date | None = None,
+                         fecha_fin: date | None = None) -> list[str]:
+    """Meses cuyo [min, max] se cruza con el rango pedido."""
+    ini = fecha_ini.isoformat() if fecha_ini else None
+    fin = fecha_fin.isoformat() if fecha_fin else None
+    meses = []
+    for mes, entrada in sorted(manifest["particiones"].items()):
+        if ini and entrada.get("max", "") < ini:
+            continue
+        if fin and entrada.get("min", "") > fin:
+            continue
+        meses.append(mes)
+    return meses
+
+
+def _leer_meses(ledger_dir: Path, manifest: dict, meses: list[str]) -> pd.DataFrame:
+    partes = [
+        pd.read_csv(ledger_dir / manifest["particiones"][mes]["archivo"])
+        for mes in meses
+    ]
+    if not partes:
+        return pd.DataFrame(columns=COLUMNAS)
+    return pd.concat(partes, ignore_index=True)
+
+
+def leer_rango(ledger_dir, fecha_ini: date | None = None,
+               fecha_fin: date | None = None) -> pd.DataFrame:
+    """
+    Lee solo las particiones que pueden tener filas en [fecha_ini, fecha_fin].
+    Devuelve las filas sin limpiar ni filtrar por fecha; eso lo hace leer_df.
+    """
+    ledger_dir = Path(ledger_dir)
+    manifest = cargar_manifest(ledger_dir)
+    return _leer_meses(ledger_dir, manifest, particiones_en_rango(manifest, fecha_ini, fecha_fin))
+
+
+def leer_ultimas(ledger_dir, n: int) -> pd.DataFrame:
+    """Últimas n filas, abriendo particiones desde la más reciente."""
+    ledger_dir = Path(ledger_dir)
+    manifest = cargar_manifest(ledger_dir)
+    meses = []
+    filas = 0
+    for mes in sorted(manifest["particiones"], reverse=True):
+        meses.insert(0, mes)
+        filas += manifest["particiones"][mes].get("filas", 0)
+        if filas >= n:
+            break
+    return _leer_meses(ledger_dir, manifest, meses).tail(n)
+
+
+def rango_fechas(ledger_dir) -> tuple[date, date] | None:
+    """(min, max) de todo el ledger usando solo el manifest."""
+    particiones = cargar_manifest(ledger_dir)["particiones"].values()
+    if not particiones:
+        return None
+    return (
+        date.fromisoformat(min(p["min"] for p in particiones)),
+        date.fromisoformat(max(p["max"] for p in particiones)),
+    )
+
+
+def totales_por_categoria(ledger_dir) -> dict[str, dict[str, float]]:
+    """Totales históricos {moneda: {categoria: total}} sin abrir ninguna partición."""
+    totales = {}
+    for entrada in cargar_manifest(ledger_dir)["particiones"].values():
+        for moneda, por_cat in _totales_por_moneda(entrada.get("totales", {})).items():
+            destino = totales.setdefault(moneda, {})
+            for cat, monto in por_cat.items():
+                destino[cat] = destino.get(cat, 0.0) + monto
+    return totales
@@ -0,0 +1,162 @@
+import json
+import os
+from pathlib import Path
+
+import pandas as pd
+
+from monedas import MONEDA_BASE, convertir, convertir_monto
+
+BASE_DIR = Path(__file__).resolve().parent
+PRESUPUESTOS_PATH = BASE_DIR / "presupuestos.json"
+CONTADORES_PATH = BASE_DIR / "presupuestos_contadores.json"
+
+# Límites y contadores van en MONEDA_BASE; los gastos en otra moneda se
+# convierten con la tasa de su fecha
+# Avisos al cruzar el 80% y el 100% del límite mensual
+UMBRALES = (0.8, 1.0)
+
+
+# ----------------------------
+# Límites (presupuestos.json)
+# ----------------------------
+def cargar_presupuestos(ruta=PRESUPUESTOS_PATH) -> dict[str, float]:
+    """{"Comida": 300.0, "Entretenimiento": 100.0, ...}"""
+    ruta = Path(ruta)
+    limites = {}
+    if ruta.exists():
+        try:
+            data = json.loads(ruta.read_text(encoding="utf-8"))
+            if isinstance(data, dict):
+                for cat, limite in data.items():
+                    try:
+                        limite = float(limite)
+                    except (TypeError, ValueError):
+                        continue
+                    if str(cat).strip() and limite > 0:
+                        limites[str(cat).strip()] = limite
+        except Exception:
+            pass
+    return limites
+
+
+def guardar_presupuestos(limites: dict[str, float], ruta=PRESUPUESTOS_PATH) -> None:
+    # Un límite en 0 significa "sin presupuesto"
+    data = {cat: float(v) for cat, v in sorted(limites.items()) if v and v > 0}
+    Path(ruta).write_text(json.dumps(
+        data, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+# ----------------------------
+# Contadores por mes/categoría
+# ----------------------------
+def _normalizar_firma(firma):
+    # Las tuplas vuelven de JSON como listas
+    return json.loads(json.dumps(firma))
+
+
+def _cargar(ruta: Path) -> dict:
+    if ruta.exists():
+        try:
+            data = json.loads(ruta.read_text(encoding="utf-8"))
+            if isinstance(data, dict) and isinstance(data.get("meses"), dict):
+                return data
+        except Exception:
+            pass
+    return {"firma": None, "meses": {}}
+
+
+def _guardar(ruta: Path, data: dict) -> None:
+    tmp = ruta.with_suffix(".tmp")
+    tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, ruta)
+
+
+def reconstruir(df: pd.DataFrame, firma, ruta=CONTADORES_PATH) -> dict:
+    """
+    Recalcula todos los contadores desde el ledger (solo si se desincronizan).
+    `df` es el ledger crudo (nucleo.leer_df): aquí se convierte a MONEDA_BASE.
+    """
+    meses = {}
+    if df is not None and not df.empty:
+        mes = pd.to_datetime(df["Fecha"], errors="coerce").dt.strftime("%Y-%m")
+        montos = convertir(df, MONEDA_BASE)
+        totales = montos.groupby([mes, df["Categoria"]]).sum()
+        for (m, cat), total in totales.items():
+            meses.setdefault(m, {})[cat] = round(float(total), 2)
+
+    data = {"firma": _normalizar_firma(firma), "meses": meses}
+    _guardar(Path(ruta), data)
+    return data
+
+
+def sincronizar(firma, leer_ledger, ruta=CONTADORES_PATH) -> dict:
+    """
+    Devuelve los contadores. Si la firma guardada no coincide con la del
+    ledger (edición externa, restauración, deduplicado) se reconstruyen.
+    """
+    data = _cargar(Path(ruta))
+    if data.get("firma") != _normalizar_firma(firma):
+        data = reconstruir(leer_ledger(), firma, ruta)
+    return data
+
+
+def _alertas(categoria: str, antes: float, despues: float, limite: float | None) -> list[dict]:
+    if not limite:
+        return []
+    return [
+        {"Categoria": categoria, "umbral": umbral, "gastado": despues, "limite": limite}
+        for umbral in UMBRALES
+        if antes < umbral * limite <= despues
+    ]
+
+
+def registrar_gasto(fecha: str, categoria: str, monto: float, firma,
+                    ruta=CONTADORES_PATH, limites: dict | None = None,
+                    moneda: str = MONEDA_BASE) -> list[dict]:
+    """
+    Suma el gasto a su contador (O(1)) y devuelve las alertas de los
+    umbrales que este gasto cruzó. `firma` es la versión del ledger ya
+    con el gasto guardado.
+    """
+    ruta = Path(ruta)
+    data = _cargar(ruta)
+    mes = str(fecha)[:7]
+    cats = data["meses"].setdefault(mes, {})
+    antes = cats.get(categoria, 0.0)
+    if moneda != MONEDA_BASE:
+        monto = convertir_monto(monto, moneda, MONEDA_BASE, fecha)
+    despues = round(antes + float(monto), 2)
+    cats[categoria] = despues
+    data["firma"] = _normalizar_firma(firma)
+    _guardar(ruta, data)
+
+    limites = cargar_presupuestos() if limites is None else limites
+    return _alertas(categoria, antes, despues, limites.get(categoria))
+
+
+def revertir_gasto(fecha: str, categoria: str, monto: float, firma,
+                   ruta=CONTADORES_PATH, moneda: str = MONEDA_BASE) -> None:
+    """Resta un gasto eliminado de su contador (O(1))."""
+    ruta = Path(ruta)
+    data = _cargar(ruta)
+    mes = str(fecha)[:7]
+    cats = data["meses"].setdefault(mes, {})
+    if moneda != MONEDA_BASE:
+        monto = convertir_monto(monto, moneda, MONEDA_BASE, fecha)
+    cats[categoria] = round(cats.get(categoria, 0.0) - float(monto), 2)
+    data["firma"] = _normalizar_firma(firma)
+    _guardar(ruta, data)
+
+
+def estado_mes(contadores: dict, mes: str, limites: dict[str, float]) -> list[dict]:
+    """Filas para las barras del dashboard: gastado vs límite por categoría."""
+    gastos = contadores["meses"].get(mes, {})
+    return [
+        {
+            "Categoria": cat,
+            "gastado": gastos.get(cat, 0.0),
+            "limite": limite,
+            "porcentaje": gastos.get(cat, 0.0) / limite,
+        }
+        for cat, limite in sorted(limites.items())
+    ]
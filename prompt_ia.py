@@ -0,0 +1,128 @@
+import csv
+import datetime
+import os
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+USO_PATH = BASE_DIR / "uso_ia.csv"
+
+# v1: prompt original (todo en un mensaje de usuario)
+# v2: instrucciones + categorías en un system fijo -> prefijo reutilizable
+VERSION_PROMPT = os.getenv("PROMPT_VERSION", "v2")
+
+# La respuesta es un JSON de 4 campos: alcanza salvo descripciones largas
+MAX_TOKENS = 80
+# Si la respuesta se cortó (finish_reason "length") se repite con este tope
+MAX_TOKENS_REINTENTO = 400
+
+# USD por millón de tokens: (entrada, entrada en caché, salida)
+PRECIOS = {
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+}
+
+COLUMNAS_USO = [
+    "Fecha", "Modelo", "Version", "PromptTokens", "CachedTokens",
+    "CompletionTokens", "LatenciaMs", "CostoUSD",
+]
+
+_lock = threading.Lock()
+
+
+# ----------------------------
+# Prompt
+# ----------------------------
+@lru_cache(maxsize=32)
+def _system(categorias: tuple[str, ...]) -> str:
+    # Mismo texto byte a byte en cada llamada para que aplique el caché de prefijo
+    return (
+        "Eres un clasificador de gastos. Del texto del usuario extrae "
+        "Monto (numero), Categoria (string), Descripcion (string) y "
+        "Moneda (codigo ISO 4217 de 3 letras; USD si el texto no la menciona).\n"
+        "Responde SOLO con un objeto JSON con esas cuatro claves.\n"
+        f"Categorias permitidas: {', '.join(categorias)}."
+    )
+
+
+def mensajes_clasificacion(texto_usuario: str, categorias, version: str = VERSION_PROMPT) -> list[dict]:
+    categorias = tuple(sorted(categorias))
+    if version == "v1":
+        prompt = (
+            "Extrae la siguiente información del texto y responde SOLO con JSON.\n"
+            "Campos obligatorios: Monto (numero), Categoria (string), Descripcion (string).\n"
+            f"Categorias permitidas: {', '.join(categorias)}.\n\n"
+            f"Texto: {texto_usuario}\n"
+        )
+        return [{"role": "user", "content": prompt}]
+    return [
+        {"role": "system", "content": _system(categorias)},
+        {"role": "user", "content": texto_usuario},
+    ]
+
+
+# ----------------------------
+# Uso / costo
+# ----------------------------
+def _costo(modelo: str, prompt: int, cached: int, completion: int) -> float:
+    entrada, entrada_cache, salida = PRECIOS.get(modelo, (0.0, 0.0, 0.0))
+    return ((prompt - cached) * entrada + cached * entrada_cache + completion * salida) / 1_000_000
+
+
+def registrar_uso(resp, latencia_s: float, modelo: str, version: str = VERSION_PROMPT,
+                  ruta=USO_PATH) -> None:
+    """Agrega una fila a uso_ia.csv con los tokens de resp.usage y la latencia."""
+    uso = getattr(resp, "usage", None)
+    if uso is None:
+        return
+    prompt = getattr(uso, "prompt_tokens", 0) or 0
+    completion = getattr(uso, "completion_tokens", 0) or 0
+    detalles = getattr(uso, "prompt_tokens_details", None)
+    cached = (getattr(detalles, "cached_tokens", 0) or 0) if detalles else 0
+
+    fila = [
+        datetime.datetime.now().isoformat(timespec="seconds"), modelo, version,
+        prompt, cached, completion, round(latencia_s * 1000, 1),
+        round(_costo(modelo, prompt, cached, completion), 8),
+    ]
+    ruta = Path(ruta)
+    with _lock:
+        nueva = not ruta.exists()
+        with open(ruta, mode="a", newline="") as file:
+            writer = csv.writer(file)
+            if nueva:
+                writer.writerow(COLUMNAS_USO)
+            writer.writerow(fila)
+
+
+def reporte_uso(ruta=USO_PATH):
+    """Promedios por versión de prompt: tokens, latencia y costo por clasificación."""
+    import pandas as pd
+
+    ruta = Path(ruta)
+    if not ruta.exists():
+        return pd.DataFrame()
+    uso = pd.read_csv(ruta)
+    return uso.groupby(["Version", "Modelo"]).agg(
+        Llamadas=("PromptTokens", "size"),
+        PromptTokens=("PromptTokens", "mean"),
+        CachedTokens=("CachedTokens", "mean"),
+        CompletionTokens=("CompletionTokens", "mean"),
+        LatenciaMs=("LatenciaMs", "mean"),
+        LatenciaP95Ms=("LatenciaMs", lambda s: s.quantile(0.95)),
+        CostoPorLlamadaUSD=("CostoUSD", "mean"),
+        CostoTotalUSD=("CostoUSD", "sum"),
+    ).round({
+        "PromptTokens": 1, "CachedTokens": 1, "CompletionTokens": 1,
+        "LatenciaMs": 1, "LatenciaP95Ms": 1,
+        "CostoPorLlamadaUSD": 6, "CostoTotalUSD": 4,
+    })
+
+
+if __name__ == "__main__":
+    reporte = reporte_uso()
+    if reporte.empty:
+        print("Aún no hay llamadas registradas en uso_ia.csv")
+    else:
+        print("==== USO DE IA POR VERSIÓN DE PROMPT ====")
+        print(reporte.to_string())
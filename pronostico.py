@@ -0,0 +1,244 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from monedas import MONEDA_BASE, convertir
+
+# Días hacia atrás que se usan para estimar el ritmo de gasto
+VENTANA_DIAS = 28
+# Meses (hasta el del gasto, inclusive) de los que salen la mediana y el MAD
+VENTANA_MESES = 6
+# z robusto (mediana/MAD) a partir del cual un gasto se marca como raro.
+# 3.0 y no el 3.5 de Iglewicz-Hoaglin: con pocas filas por categoría el MAD
+# es grande y 3.5 deja pasar el "presto" de 100 entre gastos de 8 a 45
+UMBRAL_Z = 3.0
+# Mínimo de gastos en la categoría para poder juzgar
+MIN_MUESTRAS = 5
+# Solo se revisan los gastos de los últimos N días
+DIAS_ANOMALIAS = 90
+
+
+# ----------------------------
+# Rollups (lo único que recorre filas)
+# ----------------------------
+def _agregar(df: pd.DataFrame) -> dict:
+    """
+    Agrega filas crudas (en cualquier moneda; se pasan a MONEDA_BASE) a:
+    totales diarios, conteos diarios y, por mes, conteo por categoría/monto.
+    """
+    fechas = pd.to_datetime(df["Fecha"], errors="coerce")
+    montos = convertir(df, MONEDA_BASE)
+    cats = df["Categoria"].astype(str)
+    ok = fechas.notna()
+    fechas, montos, cats = fechas[ok], montos[ok], cats[ok]
+
+    diario = montos.groupby([fechas, cats]).sum().unstack(fill_value=0.0)
+    conteo = montos.groupby(fechas).size()
+    # Montos redondeados a centavos: pocas combinaciones distintas por categoría.
+    # Separados por mes para sacar las estadísticas de una ventana móvil y
+    # para que agregar filas solo toque los meses que traen
+    redondeados = montos.round(2)
+    montos_cat = {
+        mes: serie.droplevel(0)
+        for mes, serie in redondeados.groupby(
+            [fechas.dt.to_period("M"), cats, redondeados]).size().groupby(level=0)
+    }
+    return {"diario": diario, "conteo": conteo, "montos": montos_cat}
+
+
+def _sumar(a: pd.DataFrame | pd.Series, b: pd.DataFrame | pd.Series):
+    if a is None or len(a) == 0:
+        return b
+    if b is None or len(b) == 0:
+        return a
+    return a.add(b, fill_value=0)
+
+
+def ajustar(df: pd.DataFrame, modelo: dict | None = None) -> dict:
+    """
+    Construye (o actualiza) el modelo a partir del ledger (Monto en la moneda
+    de cada fila, como lo da nucleo.leer_df). Si `modelo` viene de una
+    corrida anterior y el ledger solo creció (mismas primeras filas), se
+    agregan únicamente las filas nuevas.
+    """
+    n = len(df)
+    if n == 0:
+        return {"filas": 0, "ultima": None, "diario": pd.DataFrame(),
+                "conteo": pd.Series(dtype=float), "montos": {}, "estadisticas": {}}
+
+    ultima = tuple(df.iloc[-1][["Fecha", "Monto", "Categoria"]].astype(str))
+    incremental = (
+        modelo is not None
+        and 0 < modelo["filas"] <= n
+        and tuple(df.iloc[modelo["filas"] - 1][["Fecha", "Monto", "Categoria"]].astype(str)) == modelo["ultima"]
+    )
+
+    if incremental and modelo["filas"] == n:
+        return modelo
+    if incremental:
+        nuevo = _agregar(df.iloc[modelo["filas"]:])
+        partes = {k: _sumar(modelo[k], nuevo[k]) for k in ("diario", "conteo")}
+        partes["montos"] = dict(modelo["montos"])
+        for mes, serie in nuevo["montos"].items():
+            partes["montos"][mes] = _sumar(partes["montos"].get(mes), serie).sort_index()
+        # Las ventanas que no incluyen ningún mes tocado siguen valiendo
+        previas = {
+            mes: stats for mes, stats in modelo["estadisticas"].items()
+            if not any(mes - VENTANA_MESES < t <= mes for t in nuevo["montos"])
+        }
+    else:
+        partes = _agregar(df)
+        partes["montos"] = {mes: serie.sort_index() for mes, serie in partes["montos"].items()}
+        previas = {}
+
+    diario = partes["diario"].fillna(0.0).sort_index()
+    # Serie diaria continua (los días sin gastos cuentan como 0)
+    if not diario.empty:
+        dias = pd.date_range(diario.index.min(), diario.index.max(), freq="D")
+        diario = diario.reindex(dias, fill_value=0.0)
+
+    modelo = {
+        "filas": n,
+        "ultima": ultima,
+        "diario": diario,
+        "conteo": partes["conteo"].sort_index(),
+        "montos": partes["montos"],
+    }
+    # Mediana/MAD de los meses que puntúa detectar_anomalias, listas de antemano
+    conteo = modelo["conteo"]
+    recientes = pd.period_range(conteo.index.max() - pd.Timedelta(days=DIAS_ANOMALIAS - 1),
+                                conteo.index.max(), freq="M") if not conteo.empty else []
+    modelo["estadisticas"] = {
+        mes: previas[mes] if mes in previas else estadisticas(modelo, mes) for mes in recientes
+    }
+    return modelo
+
+
+# ----------------------------
+# Pronóstico de fin de mes
+# ----------------------------
+def pronosticar(modelo: dict, hoy: date | None = None, ventana: int = VENTANA_DIAS) -> pd.DataFrame:
+    """
+    Proyección por categoría: gastado en el mes + días restantes × ritmo diario.
+    El ritmo es (fracción de días con gasto) × (mediana de los días con gasto)
+    en la ventana, así un gasto aislado grande no dispara la proyección.
+    """
+    columnas = ["Categoria", "Gastado", "Proyeccion"]
+    diario = modelo["diario"]
+    if diario.empty:
+        return pd.DataFrame(columns=columnas)
+
+    hoy = pd.Timestamp(hoy or date.today())
+    inicio_mes = hoy.replace(day=1)
+    fin_mes = inicio_mes + pd.offsets.MonthEnd(0)
+    dias_restantes = (fin_mes - hoy).days
+
+    hasta_hoy = diario.loc[:hoy]
+    gastado = hasta_hoy.loc[inicio_mes:].sum()
+
+    reciente = hasta_hoy.reindex(
+        pd.date_range(hoy - pd.Timedelta(days=ventana - 1), hoy, freq="D"), fill_value=0.0)
+    con_gasto = reciente.where(reciente > 0)
+    ritmo = (con_gasto.notna().mean() * con_gasto.median()).fillna(0.0)
+
+    out = pd.DataFrame({
+        "Categoria": diario.columns,
+        "Gastado": gastado.reindex(diario.columns, fill_value=0.0).to_numpy(),
+        "Proyeccion": (gastado.reindex(diario.columns, fill_value=0.0) + ritmo * dias_restantes).to_numpy(),
+    })
+    out = out[(out["Gastado"] > 0) | (out["Proyeccion"] > 0)]
+    return out.sort_values("Proyeccion", ascending=False).reset_index(drop=True)
+
+
+# ----------------------------
+# Anomalías
+# ----------------------------
+def _mediana_ponderada(valores: pd.Series, pesos: pd.Series) -> pd.Series:
+    """Mediana por grupo (nivel 0 del índice) de valores con conteos."""
+    orden = pd.DataFrame({"v": valores.to_numpy(), "w": pesos.to_numpy()},
+                         index=valores.index.get_level_values(0))
+    orden = orden.sort_values("v", kind="stable").sort_index(kind="stable")
+    acumulado = orden.groupby(level=0)["w"].cumsum()
+    mitad = orden.groupby(level=0)["w"].transform("sum") / 2
+    return orden["v"][acumulado >= mitad].groupby(level=0).first()
+
+
+def estadisticas(modelo: dict, mes: pd.Period | None = None,
+                 meses: int = VENTANA_MESES) -> pd.DataFrame:
+    """
+    Mediana y MAD del monto por categoría en los `meses` que terminan en
+    `mes` (por defecto el último del modelo), sacadas del conteo por monto.
+    """
+    if not modelo["montos"]:
+        return pd.DataFrame(columns=["mediana", "mad", "n"])
+    mes = max(modelo["montos"]) if mes is None else mes
+    ventana = [serie for m, serie in modelo["montos"].items() if mes - meses < m <= mes]
+    if not ventana:
+        return pd.DataFrame(columns=["mediana", "mad", "n"])
+    montos = pd.concat(ventana).groupby(level=[0, 1]).sum()
+
+    valores = pd.Series(montos.index.get_level_values(1).to_numpy(dtype=float), index=montos.index)
+    mediana = _mediana_ponderada(valores, montos)
+    desvio = (valores - mediana.reindex(montos.index.get_level_values(0)).to_numpy()).abs()
+    mad = _mediana_ponderada(desvio, montos)
+    n = montos.groupby(level=0).sum()
+    return pd.DataFrame({"mediana": mediana, "mad": mad, "n": n})
+
+
+def detectar_anomalias(modelo: dict, df: pd.DataFrame, dias: int = DIAS_ANOMALIAS,
+                       umbral: float = UMBRAL_Z) -> pd.DataFrame:
+    """
+    Gastos recientes con z robusto = (monto - mediana) / (1.4826 × MAD)
+    por encima del umbral, con mediana y MAD de la ventana de VENTANA_MESES
+    que termina en el mes de cada gasto. Solo se puntúan (y convierten) las
+    filas de los últimos `dias`: la cola del ledger, que se agrega en orden
+    cronológico.
+
+    El caso de gastos.csv: un "presto" de 100 entre gastos de Comida de 8 a 45
+    (python -m doctest pronostico.py).
+
+    >>> montos = [45, 30, 8, 30, 45, 8, 100, 24, 30, 50]
+    >>> df = pd.DataFrame({"Fecha": ["2026-02-17"] * 3 + ["2026-02-19"] * 4 + ["2026-02-20"] * 3,
+    ...                    "Monto": montos, "Categoria": "Comida", "Descripcion": "",
+    ...                    "Moneda": "USD"})
+    >>> df.loc[6, "Descripcion"] = "presto"
+    >>> anomalias = detectar_anomalias(ajustar(df), df)
+    >>> anomalias[["Descripcion", "Monto", "z"]].values.tolist()
+    [['presto', 100, 3.15]]
+    """
+    conteo = modelo["conteo"]
+    if conteo.empty or not modelo["montos"]:
+        return pd.DataFrame(columns=[*df.columns, "z"])
+
+    desde = conteo.index.max() - pd.Timedelta(days=dias - 1)
+    cola = df.tail(int(conteo.loc[desde:].sum()))
+    meses_cola = pd.to_datetime(cola["Fecha"], errors="coerce").dt.to_period("M")
+
+    # Una ventana por mes presente en la cola (a lo sumo 4 con 90 días)
+    por_mes = {}
+    for mes in meses_cola.dropna().unique():
+        stats = modelo["estadisticas"].get(mes)
+        if stats is None:
+            stats = estadisticas(modelo, mes)
+        por_mes[mes] = stats[(stats["n"] >= MIN_MUESTRAS) & (stats["mad"] > 0)]
+    if not por_mes:
+        return pd.DataFrame(columns=[*df.columns, "z"])
+    stats = pd.concat(por_mes)
+    claves = pd.MultiIndex.from_arrays([meses_cola, cola["Categoria"].astype(str)])
+
+    mediana = stats["mediana"].reindex(claves).to_numpy()
+    escala = stats["mad"].reindex(claves).to_numpy() * 1.4826
+    z = (convertir(cola, MONEDA_BASE).to_numpy() - mediana) / escala
+    # Sin estadísticas para su mes/categoría (NaN): no se marca
+    marcar = np.nan_to_num(z, nan=-np.inf) > umbral
+
+    marcadas = cola[marcar].copy()
+    marcadas["z"] = np.round(z[marcar], 2)
+    return marcadas.sort_values("z", ascending=False)
+
+
+def analizar(df: pd.DataFrame, hoy: date | None = None, modelo: dict | None = None):
+    """Atajo para los CLIs: devuelve (modelo, pronóstico, anomalías)."""
+    modelo = ajustar(df, modelo)
+    return modelo, pronosticar(modelo, hoy), detectar_anomalias(modelo, df)
@@ -0,0 +1,245 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+from monedas import COLUMNAS, MONEDA_BASE, convertir, version_tasas
+
+ESTADO = ".estado.json"
+
+# Comienzo de una fila del ledger: "AAAA-MM-DD,"
+_INICIO_FILA = re.compile(rb"\d{4}-\d{2}-\d{2},")
+
+
+# ----------------------------
+# Helpers
+# ----------------------------
+def _nombre_archivo(categoria: str) -> str:
+    """Convierte una categoría en un nombre de archivo seguro."""
+    nombre = re.sub(r"[^\w\- ]", "_", categoria.strip()) or "Sin_categoria"
+    return f"{nombre}.csv"
+
+
+def _monto(valor) -> float:
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _segmentos_csv(archivo: Path) -> dict[str, list[tuple]]:
+    """
+    Una pasada por los bytes del CSV (sin parsearlo) que anota, por mes,
+    los tramos [ini, fin) de líneas consecutivas de ese mes. Cada worker
+    lee y parsea solo sus tramos.
+    """
+    segmentos = {}
+    actual, ini = None, None
+    with open(archivo, mode="rb") as file:
+        file.readline()  # encabezado
+        pos = file.tell()
+        for linea in file:
+            mes = linea[:7]
+            # Mismo mes que la línea anterior (lo normal en un ledger por fecha)
+            # o una línea de continuación (campo con salto de línea)
+            if mes != actual and _INICIO_FILA.match(linea):
+                if actual is not None:
+                    segmentos.setdefault(actual.decode(), []).append((str(archivo), ini, pos))
+                actual, ini = mes, pos
+            pos += len(linea)
+        if actual is not None:
+            segmentos.setdefault(actual.decode(), []).append((str(archivo), ini, pos))
+    return segmentos
+
+
+def _segmentos_particiones(ledger_dir: Path) -> dict[str, list[tuple]]:
+    """Ledger particionado (ledger/AAAA/MM.csv): un tramo por partición."""
+    segmentos = {}
+    for ruta in sorted(ledger_dir.glob("*/*.csv")):
+        mes = f"{ruta.parent.name}-{ruta.stem}"
+        if not re.fullmatch(r"\d{4}-\d{2}", mes):
+            continue
+        with open(ruta, mode="rb") as file:
+            file.readline()
+            segmentos[mes] = [(str(ruta), file.tell(), ruta.stat().st_size)]
+    return segmentos
+
+
+def segmentos_por_mes(archivo) -> dict[str, list[tuple]]:
+    """
+    {mes: [(ruta, ini, fin), ...]} para un CSV (gastos.csv) o un directorio
+    particionado. Es lo único que se manda a los workers: nada de filas.
+    """
+    archivo = Path(archivo)
+    if archivo.is_dir():
+        return _segmentos_particiones(archivo)
+    return _segmentos_csv(archivo)
+
+
+def _leer_segmentos(mes: str, segmentos: list[tuple]) -> list[dict]:
+    """Filas del mes (en orden de archivo) leyendo solo los tramos indicados."""
+    filas = []
+    encabezados = {}
+    for ruta, ini, fin in segmentos:
+        with open(ruta, mode="rb") as file:
+            if ruta not in encabezados:
+                encabezados[ruta] = next(csv.reader([file.readline().decode("utf-8")]))
+            file.seek(ini)
+            texto = file.read(fin - ini).decode("utf-8")
+        for fila in csv.DictReader(io.StringIO(texto, newline=""), fieldnames=encabezados[ruta]):
+            if (fila.get("Fecha") or "").strip()[:7] == mes:
+                filas.append(fila)
+    return filas
+
+
+def _moneda(fila: dict) -> str:
+    # Filas sin columna Moneda (CSVs viejos) están en MONEDA_BASE
+    return (fila.get("Moneda") or MONEDA_BASE).strip() or MONEDA_BASE
+
+
+def _montos_base(filas: list[dict], monedas: list[str]) -> list[float]:
+    """Monto de cada fila en MONEDA_BASE (tasa vigente en su fecha)."""
+    montos = [_monto(fila.get("Monto")) for fila in filas]
+    if all(moneda == MONEDA_BASE for moneda in monedas):
+        return montos
+    df = pd.DataFrame({"Fecha": [fila.get("Fecha") for fila in filas],
+                       "Monto": montos, "Moneda": monedas})
+    return convertir(df, MONEDA_BASE).tolist()
+
+
+def _huella(filas: list[dict]) -> str:
+    """sha256 de las filas del mes: dice si cambió desde la última corrida."""
+    hasher = hashlib.sha256()
+    for fila in filas:
+        hasher.update(
+            "\x1f".join(str(fila.get(c, "")) for c in COLUMNAS).encode("utf-8") + b"\n")
+    return hasher.hexdigest()
+
+
+def _cargar_estado(destino: Path) -> dict:
+    ruta = destino / ESTADO
+    if not ruta.exists():
+        return {}
+    try:
+        data = json.loads(ruta.read_text(encoding="utf-8"))
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
+
+# ----------------------------
+# Worker (corre en otro proceso)
+# ----------------------------
+def generar_mes(mes: str, segmentos: list[tuple], destino: str,
+                huella_anterior: str | None = None) -> dict:
+    """
+    Lee los tramos del mes, calcula su huella y, si cambió (o falta el
+    resumen), escribe reportes/<mes>/<Categoria>.csv y resumen.json.
+    Devuelve {"mes", "huella", "generado"}.
+    """
+    filas = _leer_segmentos(mes, segmentos)
+    monedas = [_moneda(fila) for fila in filas]
+    huella = _huella(filas)
+    if any(moneda != MONEDA_BASE for moneda in monedas):
+        # Los totales convertidos cambian si se edita tasas_cambio.csv
+        huella = hashlib.sha256(f"{huella}{version_tasas()}".encode("utf-8")).hexdigest()
+    carpeta = Path(destino) / mes
+    if huella == huella_anterior and (carpeta / "resumen.json").exists():
+        return {"mes": mes, "huella": huella, "generado": False}
+
+    if carpeta.exists():
+        shutil.rmtree(carpeta)
+    carpeta.mkdir(parents=True)
+
+    archivos = {}
+    writers = {}
+    totales = {}
+    conteos = {}
+    por_moneda = {}
+    try:
+        for fila, moneda, monto_base in zip(filas, monedas, _montos_base(filas, monedas)):
+            categoria = (fila.get("Categoria") or "Otros").strip() or "Otros"
+            if categoria not in writers:
+                file = open(carpeta / _nombre_archivo(categoria),
+                            mode="w", newline="", encoding="utf-8")
+                archivos[categoria] = file
+                writers[categoria] = csv.DictWriter(
+                    file, fieldnames=COLUMNAS, extrasaction="ignore")
+                writers[categoria].writeheader()
+            writers[categoria].writerow(fila)
+            totales[categoria] = totales.get(categoria, 0.0) + monto_base
+            conteos[categoria] = conteos.get(categoria, 0) + 1
+            por_moneda[moneda] = por_moneda.get(moneda, 0.0) + _monto(fila.get("Monto"))
+    finally:
+        for file in archivos.values():
+            file.close()
+
+    resumen = {
+        "mes": mes,
+        # Totales (del mes y por categoría) en MONEDA_BASE;
+        # por_moneda son los montos originales, sin convertir
+        "moneda": MONEDA_BASE,
+        "total": round(sum(totales.values()), 2),
+        "movimientos": sum(conteos.values()),
+        "por_moneda": {moneda: round(total, 2) for moneda, total in sorted(por_moneda.items())},
+        "categorias": {
+            cat: {"total": round(totales[cat], 2), "movimientos": conteos[cat]}
+            for cat in sorted(totales, key=totales.get, reverse=True)
+        },
+    }
+    (carpeta / "resumen.json").write_text(
+        json.dumps(resumen, ensure_ascii=False, indent=2), encoding="utf-8")
+    return {"mes": mes, "huella": huella, "generado": True}
+
+
+# ----------------------------
+# API
+# ----------------------------
+def generar_reportes(archivo, destino="reportes", solo_cambios=False, procesos=None) -> dict:
+    """
+    Genera los reportes de todos los meses del ledger en paralelo.
+    `archivo` es gastos.csv o el directorio del ledger particionado; cada
+    worker lee y parsea solo su mes. Con solo_cambios=True no se reescriben
+    los meses cuyas filas no cambiaron desde la última corrida (según
+    reportes/.estado.json).
+    Devuelve {"generados": [...], "omitidos": [...]}.
+    """
+    destino = Path(destino)
+    destino.mkdir(parents=True, exist_ok=True)
+
+    segmentos = segmentos_por_mes(archivo)
+    estado = _cargar_estado(destino) if solo_cambios else {}
+
+    resultados = []
+    if segmentos:
+        procesos = procesos or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=min(procesos, len(segmentos))) as pool:
+            futuros = [
+                pool.submit(generar_mes, mes, segmentos[mes], str(destino), estado.get(mes))
+                for mes in sorted(segmentos)
+            ]
+            resultados = [futuro.result() for futuro in futuros]
+
+    # Índice general a partir de los resumen.json de cada mes
+    indice = {}
+    for mes in sorted(segmentos):
+        ruta = destino / mes / "resumen.json"
+        if ruta.exists():
+            indice[mes] = json.loads(ruta.read_text(encoding="utf-8"))
+    (destino / "indice.json").write_text(
+        json.dumps(indice, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    huellas = {r["mes"]: r["huella"] for r in resultados}
+    (destino / ESTADO).write_text(json.dumps(huellas, indent=2), encoding="utf-8")
+
+    return {
+        "generados": [r["mes"] for r in resultados if r["generado"]],
+        "omitidos": [r["mes"] for r in resultados if not r["generado"]],
+    }
@@ -0,0 +1,266 @@
+import datetime
+import hashlib
+import json
+import os
+import zlib
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+RESPALDO_DIR = BASE_DIR / "carpeta_respaldo"
+
+# Cortes de chunk definidos por contenido (al final de una línea):
+# así agregar o borrar una fila solo cambia el chunk donde cae.
+CHUNK_MIN = 64 * 1024
+CHUNK_MAX = 512 * 1024
+DIVISOR = 1024  # ~1 de cada 1024 líneas corta un chunk (después de CHUNK_MIN)
+
+# Retención por defecto
+CONSERVAR_ULTIMOS = 10
+CONSERVAR_DIAS = 30
+
+
+# ----------------------------
+# Objetos (chunks direccionados por contenido)
+# ----------------------------
+def _dir_objetos(respaldo_dir: Path) -> Path:
+    return respaldo_dir / "objetos"
+
+
+def _dir_snapshots(respaldo_dir: Path) -> Path:
+    return respaldo_dir / "snapshots"
+
+
+def _ruta_objeto(respaldo_dir: Path, huella: str) -> Path:
+    return _dir_objetos(respaldo_dir) / huella[:2] / huella
+
+
+def _guardar_objeto(respaldo_dir: Path, datos: bytes) -> str:
+    """Guarda el chunk comprimido solo si no existe ya. Devuelve su sha256."""
+    huella = hashlib.sha256(datos).hexdigest()
+    ruta = _ruta_objeto(respaldo_dir, huella)
+    if not ruta.exists():
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        tmp = ruta.with_suffix(".tmp")
+        tmp.write_bytes(zlib.compress(datos, 6))
+        os.replace(tmp, ruta)
+    return huella
+
+
+def _leer_objeto(respaldo_dir: Path, huella: str) -> bytes:
+    datos = zlib.decompress(_ruta_objeto(respaldo_dir, huella).read_bytes())
+    if hashlib.sha256(datos).hexdigest() != huella:
+        raise ValueError(f"Chunk corrupto en el respaldo: {huella}")
+    return datos
+
+
+def _trocear(file, respaldo_dir: Path, offset: int) -> list[list]:
+    """Lee desde offset hasta el final y devuelve [[sha256, offset, largo], ...]."""
+    file.seek(offset)
+    chunks = []
+    buffer = []
+    largo = 0
+    for linea in file:
+        buffer.append(linea)
+        largo += len(linea)
+        corte = largo >= CHUNK_MIN and zlib.crc32(linea) % DIVISOR == 0
+        if corte or largo >= CHUNK_MAX:
+            chunks.append([_guardar_objeto(respaldo_dir, b"".join(buffer)), offset, largo])
+            offset += largo
+            buffer, largo = [], 0
+    if buffer:
+        chunks.append([_guardar_objeto(respaldo_dir, b"".join(buffer)), offset, largo])
+    return chunks
+
+
+def _respaldar_archivo(ruta: Path, respaldo_dir: Path, anterior: dict | None,
+                       verificar: bool) -> dict:
+    stat = ruta.stat()
+    entrada = {"tamano": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    # Sin cambios desde el último snapshot: se reutiliza la lista de chunks
+    if (not verificar and anterior
+            and anterior["tamano"] == stat.st_size
+            and anterior["mtime_ns"] == stat.st_mtime_ns):
+        entrada["chunks"] = anterior["chunks"]
+        return entrada
+
+    with open(ruta, mode="rb") as file:
+        # Caso típico (solo se agregaron filas): si el último chunk anterior
+        # sigue igual, solo se trocea desde ahí en adelante.
+        if (not verificar and anterior and anterior["chunks"]
+                and stat.st_size >= anterior["tamano"]):
+            huella, offset, largo = anterior["chunks"][-1]
+            file.seek(offset)
+            if hashlib.sha256(file.read(largo)).hexdigest() == huella:
+                entrada["chunks"] = anterior["chunks"][:-1] + _trocear(file, respaldo_dir, offset)
+                return entrada
+
+        entrada["chunks"] = _trocear(file, respaldo_dir, 0)
+    return entrada
+
+
+# ----------------------------
+# Snapshots
+# ----------------------------
+def ids_snapshots(respaldo_dir: Path) -> list[str]:
+    """Ids ordenados del más viejo al más nuevo (el id es la fecha/hora)."""
+    carpeta = _dir_snapshots(respaldo_dir)
+    if not carpeta.exists():
+        return []
+    return sorted(ruta.stem for ruta in carpeta.glob("*.json"))
+
+
+def _cargar_snapshot(respaldo_dir: Path, snapshot_id: str) -> dict:
+    ruta = _dir_snapshots(respaldo_dir) / f"{snapshot_id}.json"
+    if not ruta.exists():
+        raise FileNotFoundError(f"No existe el snapshot {snapshot_id}")
+    return json.loads(ruta.read_text(encoding="utf-8"))
+
+
+def fecha_snapshot(snapshot_id: str) -> datetime.datetime:
+    return datetime.datetime.strptime(snapshot_id, "%Y%m%dT%H%M%S%f")
+
+
+def listar_snapshots(respaldo_dir=RESPALDO_DIR) -> list[dict]:
+    """Snapshots del más viejo al más nuevo."""
+    respaldo_dir = Path(respaldo_dir)
+    snapshots = []
+    for snapshot_id in ids_snapshots(respaldo_dir):
+        try:
+            snapshots.append(_cargar_snapshot(respaldo_dir, snapshot_id))
+        except Exception:
+            continue
+    return snapshots
+
+
+def respaldar(archivos, motivo: str = "manual", base_dir=BASE_DIR,
+              respaldo_dir=RESPALDO_DIR, verificar: bool = False) -> dict:
+    """
+    Crea un snapshot de los archivos del ledger. Solo se escriben los
+    chunks que no estaban ya en carpeta_respaldo/objetos.
+    Con verificar=False se confía en tamaño/mtime (como rsync) y, si el
+    archivo creció, solo se trocea la cola; con verificar=True se relee todo.
+    """
+    base_dir = Path(base_dir)
+    respaldo_dir = Path(respaldo_dir)
+    _dir_snapshots(respaldo_dir).mkdir(parents=True, exist_ok=True)
+
+    ids = ids_snapshots(respaldo_dir)
+    anteriores = _cargar_snapshot(respaldo_dir, ids[-1])["archivos"] if ids else {}
+
+    ahora = datetime.datetime.now()
+    snapshot = {
+        "id": ahora.strftime("%Y%m%dT%H%M%S%f"),
+        "creado": ahora.isoformat(timespec="seconds"),
+        "motivo": motivo,
+        "archivos": {},
+        # Archivos del ledger que no existían (ej. delta.csv): al restaurar se borran
+        "ausentes": [],
+    }
+    for ruta in archivos:
+        ruta = Path(ruta)
+        nombre = ruta.resolve().relative_to(base_dir.resolve()).as_posix()
+        if not ruta.exists():
+            snapshot["ausentes"].append(nombre)
+            continue
+        snapshot["archivos"][nombre] = _respaldar_archivo(
+            ruta, respaldo_dir, anteriores.get(nombre), verificar)
+
+    destino = _dir_snapshots(respaldo_dir) / f"{snapshot['id']}.json"
+    destino.write_text(json.dumps(snapshot, ensure_ascii=False), encoding="utf-8")
+    return snapshot
+
+
+def snapshot_en(momento: datetime.datetime, respaldo_dir=RESPALDO_DIR) -> dict | None:
+    """Último snapshot creado en o antes de `momento` (restore a un punto en el tiempo)."""
+    respaldo_dir = Path(respaldo_dir)
+    candidatos = [i for i in ids_snapshots(respaldo_dir) if fecha_snapshot(i) <= momento]
+    return _cargar_snapshot(respaldo_dir, candidatos[-1]) if candidatos else None
+
+
+def restaurar(snapshot_id: str, base_dir=BASE_DIR, respaldo_dir=RESPALDO_DIR,
+              actuales=()) -> list[str]:
+    """
+    Reconstruye los archivos del snapshot en su ruta original y borra los
+    que no estaban en él: los marcados como ausentes y, de `actuales` (los
+    archivos del ledger hoy), los creados después. Devuelve las rutas restauradas.
+    """
+    base_dir = Path(base_dir)
+    respaldo_dir = Path(respaldo_dir)
+    snapshot = _cargar_snapshot(respaldo_dir, snapshot_id)
+
+    restaurados = []
+    for nombre, entrada in snapshot["archivos"].items():
+        destino = base_dir / nombre
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        tmp = destino.with_name(destino.name + ".restaurando")
+        with open(tmp, mode="wb") as file:
+            for huella, _offset, _largo in entrada["chunks"]:
+                file.write(_leer_objeto(respaldo_dir, huella))
+        os.replace(tmp, destino)
+        restaurados.append(nombre)
+
+    # Sin esto un delta.csv o una partición nueva sobreviven al restore
+    sobrantes = set(snapshot.get("ausentes", []))
+    for ruta in actuales:
+        sobrantes.add(Path(ruta).resolve().relative_to(base_dir.resolve()).as_posix())
+    for nombre in sobrantes - set(snapshot["archivos"]):
+        (base_dir / nombre).unlink(missing_ok=True)
+    return restaurados
+
+
+# ----------------------------
+# Retención / programación
+# ----------------------------
+def aplicar_retencion(respaldo_dir=RESPALDO_DIR, conservar_ultimos: int = CONSERVAR_ULTIMOS,
+                      conservar_dias: int = CONSERVAR_DIAS) -> int:
+    """
+    Conserva los últimos N snapshots más uno por día de los últimos D días.
+    Borra el resto y los chunks que ya no usa ningún snapshot.
+    Devuelve cuántos snapshots se borraron.
+    """
+    respaldo_dir = Path(respaldo_dir)
+    snapshots = listar_snapshots(respaldo_dir)
+    limite = datetime.datetime.now() - datetime.timedelta(days=conservar_dias)
+
+    conservar = {s["id"] for s in snapshots[-conservar_ultimos:]} if conservar_ultimos else set()
+    por_dia = {}
+    for s in snapshots:
+        creado = datetime.datetime.fromisoformat(s["creado"])
+        if creado >= limite:
+            por_dia[creado.date()] = s["id"]  # el último de cada día
+    conservar.update(por_dia.values())
+
+    borrados = 0
+    for s in snapshots:
+        if s["id"] not in conservar:
+            (_dir_snapshots(respaldo_dir) / f"{s['id']}.json").unlink(missing_ok=True)
+            borrados += 1
+
+    # Recolección de chunks huérfanos
+    usados = {
+        huella
+        for s in snapshots if s["id"] in conservar
+        for entrada in s["archivos"].values()
+        for huella, _offset, _largo in entrada["chunks"]
+    }
+    objetos = _dir_objetos(respaldo_dir)
+    if objetos.exists():
+        for ruta in objetos.glob("*/*"):
+            if ruta.name not in usados:
+                ruta.unlink()
+    return borrados
+
+
+def respaldo_programado(archivos, intervalo_horas: float = 24, base_dir=BASE_DIR,
+                        respaldo_dir=RESPALDO_DIR) -> dict | None:
+    """Si el último snapshot es más viejo que el intervalo, crea uno verificado."""
+    ids = ids_snapshots(Path(respaldo_dir))
+    if ids:
+        ultimo = fecha_snapshot(ids[-1])
+        if datetime.datetime.now() - ultimo < datetime.timedelta(hours=intervalo_horas):
+            return None
+    snapshot = respaldar(archivos, motivo="programado", base_dir=base_dir,
+                         respaldo_dir=respaldo_dir, verificar=True)
+    aplicar_retencion(respaldo_dir)
+    return snapshot
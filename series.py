@@ -0,0 +1,86 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+# Tope de puntos que se mandan al navegador, sin importar los años de datos
+MAX_PUNTOS = 400
+
+# Nombre -> regla de resample
+GRANULARIDADES = {"Día": "D", "Semana": "W-MON", "Mes": "MS"}
+
+
+def granularidad_para(fecha_ini: date, fecha_fin: date) -> str:
+    """Elige la granularidad según el largo del rango de fechas."""
+    dias = (fecha_fin - fecha_ini).days + 1
+    if dias <= 92:
+        return "Día"
+    if dias <= 2 * 365:
+        return "Semana"
+    return "Mes"
+
+
+def precalcular(df: pd.DataFrame) -> dict[str, pd.Series]:
+    """
+    Serie diaria continua (días sin gastos = 0) y sus resamples semanal y
+    mensual. Se calcula una vez por conjunto de filtros.
+    """
+    if df.empty:
+        vacia = pd.Series(dtype=float)
+        return {nombre: vacia for nombre in GRANULARIDADES}
+
+    fechas = pd.to_datetime(df["Fecha"], errors="coerce")
+    diario = pd.to_numeric(df["Monto"], errors="coerce").fillna(0.0).groupby(fechas).sum()
+    diario = diario.asfreq("D", fill_value=0.0)
+
+    return {
+        "Día": diario,
+        # Semanas que empiezan el lunes, como "Semana" en totales_por_periodo
+        "Semana": diario.resample("W-MON", label="left", closed="left").sum(),
+        "Mes": diario.resample("MS").sum(),
+    }
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: índices de n puntos que conservan la
+    forma de la serie (picos y valles), siempre con el primero y el último.
+    """
+    largo = len(x)
+    if n >= largo or n < 3:
+        return np.arange(largo)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    paso = (largo - 2) / (n - 2)
+
+    elegidos = np.empty(n, dtype=int)
+    elegidos[0] = 0
+    a = 0
+    for i in range(n - 2):
+        # Promedio del cubo siguiente (el tercer vértice del triángulo)
+        sig_ini = int((i + 1) * paso) + 1
+        sig_fin = min(int((i + 2) * paso) + 1, largo)
+        prom_x = x[sig_ini:sig_fin].mean()
+        prom_y = y[sig_ini:sig_fin].mean()
+
+        ini = int(i * paso) + 1
+        fin = int((i + 1) * paso) + 1
+        areas = np.abs(
+            (x[a] - prom_x) * (y[ini:fin] - y[a])
+            - (x[a] - x[ini:fin]) * (prom_y - y[a])
+        )
+        a = ini + int(areas.argmax())
+        elegidos[i + 1] = a
+    elegidos[-1] = largo - 1
+    return elegidos
+
+
+def serie_para_grafico(series: dict[str, pd.Series], granularidad: str,
+                       max_puntos: int = MAX_PUNTOS) -> pd.DataFrame:
+    """DataFrame Fecha/Monto listo para px.line, con a lo sumo max_puntos filas."""
+    serie = series[granularidad]
+    if len(serie) > max_puntos:
+        x = serie.index.to_numpy(dtype="datetime64[D]").astype(np.int64)
+        serie = serie.iloc[lttb(x, serie.to_numpy(), max_puntos)]
+    return pd.DataFrame({"Fecha": serie.index, "Monto": serie.to_numpy()})